@@ -0,0 +1,242 @@
+# benchmarks.py
+# -------------
+# Timing harness for the data structures and solvers behind the
+# reinforcement learning agents.  Run, for example,
+#
+#   python benchmarks.py -b pqueue -s 1000,10000,100000
+#   python benchmarks.py -b scaling -s 100,10000,1000000 -o scaling.json
+#
+# Each benchmark returns a list of result rows (dicts) which are
+# printed as a table and, with -o, written as JSON together with the
+# project version so that runs can be compared across versions.
+
+
+import json
+import optparse
+import os
+import platform
+import random
+import time
+
+import gridworld
+import gridworldGenerator
+import qlearningAgents
+import util
+import valueIterationAgents
+
+
+def timeCall(function, *args):
+    "Returns the wall-clock seconds taken by function(*args)."
+    startTime = time.time()
+    function(*args)
+    return time.time() - startTime
+
+def printResults(results):
+    for row in results:
+        print('  %-12s %-24s %10d  %10.4fs' % (row['benchmark'], row['implementation'],
+                                              row['size'], row['seconds']))
+
+def writeResults(results, fileName):
+    "Writes results as JSON, tagged with the project version and platform."
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'VERSION')) as handle:
+        version = handle.read().strip()
+    report = {'version': version,
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results': results}
+    with open(fileName, 'w') as handle:
+        json.dump(report, handle, indent=1, sort_keys=True)
+
+
+######################
+# PRIORITY QUEUES    #
+######################
+
+def priorityQueueWorkload(queue, items, priorities, updates):
+    """
+    The access pattern of prioritized sweeping: every item is pushed
+    once, then priorities are lowered through update, then the queue is
+    drained.
+    """
+    for item, priority in zip(items, priorities):
+        queue.push(item, priority)
+    for item, priority in updates:
+        queue.update(item, priority)
+    while not queue.isEmpty():
+        queue.pop()
+
+def benchmarkPriorityQueues(sizes, maxLinearSize=8000):
+    """
+    Compares util.PriorityQueue (linear-scan update) against
+    util.IndexedPriorityQueue (O(log n) update) on n pushes, n updates
+    and n pops.  The plain queue is quadratic, so it is skipped above
+    maxLinearSize items.
+    """
+    results = []
+    for size in sizes:
+        rand = random.Random(size)
+        items = list(range(size))
+        priorities = [rand.random() for item in items]
+        updates = [(rand.randrange(size), -rand.random()) for item in items]
+        for queueClass in (util.PriorityQueue, util.IndexedPriorityQueue):
+            if queueClass is util.PriorityQueue and size > maxLinearSize:
+                continue
+            seconds = timeCall(priorityQueueWorkload, queueClass(), items, priorities, updates)
+            results.append({'benchmark': 'pqueue', 'implementation': queueClass.__name__,
+                            'size': size, 'seconds': seconds})
+    return results
+
+
+######################
+# SUM TREES          #
+######################
+
+def sumTreeUpdates(tree, updates):
+    for index, value in updates:
+        tree[index] = value
+
+def sumTreeSamples(tree, samples):
+    for i in range(samples):
+        tree.sample()
+
+def benchmarkSumTrees(sizes, operations=100000):
+    """
+    Times filling a util.SumTree of n values, then a fixed number of
+    random updates and of proportional samples, so the per-operation
+    cost can be compared across sizes.
+    """
+    results = []
+    for size in sizes:
+        rand = random.Random(size)
+        tree = util.SumTree(size)
+        values = [(index, rand.random()) for index in range(size)]
+        updates = [(rand.randrange(size), rand.random()) for i in range(operations)]
+        for implementation, function, argument in (('SumTree/fill', sumTreeUpdates, values),
+                                                   ('SumTree/update', sumTreeUpdates, updates),
+                                                   ('SumTree/sample', sumTreeSamples, operations)):
+            results.append({'benchmark': 'sumtree', 'implementation': implementation, 'size': size,
+                            'seconds': timeCall(function, tree, argument)})
+    return results
+
+
+######################
+# GRIDWORLD SCALING  #
+######################
+
+def runQLearningEpisodes(grid, episodes, maxSteps, seed, table='counter'):
+    """
+    Runs epsilon-greedy Q-learning episodes of at most maxSteps steps
+    and returns the number of steps taken.  table is passed on to
+    QLearningAgent.
+    """
+    random.seed(seed)
+    environment = gridworld.GridworldEnvironment(grid)
+    agent = qlearningAgents.QLearningAgent(actionFn=grid.getPossibleActions,
+                                           epsilon=0.3, alpha=0.5, gamma=0.9, table=table)
+    steps = 0
+    for episode in range(episodes):
+        environment.reset()
+        agent.startEpisode()
+        for step in range(maxSteps):
+            state = environment.getCurrentState()
+            if len(environment.getPossibleActions(state)) == 0:
+                break
+            action = agent.getAction(state)
+            nextState, reward = environment.doAction(action)
+            agent.observeTransition(state, action, nextState, reward)
+            steps += 1
+        agent.stopEpisode()
+    return steps
+
+def benchmarkScaling(sizes, kinds=('maze', 'rooms', 'cliff'), seed=0, iterations=200,
+                     tolerance=1e-3, episodes=10, maxSteps=1000):
+    """
+    For each generated grid kind and size (in cells), times building the
+    grid, the first getStates() call, compiling it, a batched value
+    iteration solve (stopping at tolerance, at most iterations sweeps)
+    and a few capped Q-learning episodes.
+    """
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            def record(stage, seconds, **extra):
+                row = {'benchmark': 'scaling', 'implementation': '%s/%s' % (kind, stage),
+                       'size': size, 'seconds': seconds}
+                row.update(extra)
+                results.append(row)
+
+            startTime = time.time()
+            grid = gridworldGenerator.generateGridworld(kind, size, seed)
+            record('construct', time.time() - startTime)
+
+            startTime = time.time()
+            states = grid.getStates()
+            record('getStates', time.time() - startTime, states=len(states))
+
+            startTime = time.time()
+            grid.compile()
+            record('compile', time.time() - startTime)
+
+            startTime = time.time()
+            agent = valueIterationAgents.ValueIterationAgent(grid, 0.9, iterations, engine='batched',
+                                                             tolerance=tolerance)
+            record('valueIteration', time.time() - startTime,
+                   sweeps=agent.stats.getSweeps(), converged=agent.stats.converged)
+
+            startTime = time.time()
+            steps = runQLearningEpisodes(grid, episodes, maxSteps, seed)
+            record('qlearning', time.time() - startTime, steps=steps)
+    return results
+
+def benchmarkQTables(sizes, kind='rooms', seed=0, episodes=20, maxSteps=2000):
+    """
+    Times the same capped Q-learning episodes with the Counter and the
+    dense Q-table on generated grids of each size.  Both tables learn the
+    same values, so both runs take the same number of steps.
+    """
+    results = []
+    for size in sizes:
+        grid = gridworldGenerator.generateGridworld(kind, size, seed)
+        for table in ('counter', 'dense'):
+            startTime = time.time()
+            steps = runQLearningEpisodes(grid, episodes, maxSteps, seed, table)
+            results.append({'benchmark': 'qtable', 'implementation': table, 'size': size,
+                            'seconds': time.time() - startTime, 'steps': steps})
+    return results
+
+
+BENCHMARKS = {
+    'pqueue': (benchmarkPriorityQueues, '1000,4000,16000,64000'),
+    'qtable': (benchmarkQTables, '100,10000,1000000'),
+    'scaling': (benchmarkScaling, '100,1000,10000,100000'),
+    'sumtree': (benchmarkSumTrees, '1000,10000,100000,1000000'),
+    }
+
+def parseOptions():
+    optParser = optparse.OptionParser()
+    optParser.add_option('-b', '--benchmark', action='store', type='string',
+                         dest='benchmark', default='pqueue',
+                         help='Benchmark to run (options are %s, default %%default)' %
+                         ', '.join(sorted(BENCHMARKS)))
+    optParser.add_option('-s', '--sizes', action='store', type='string',
+                         dest='sizes', default=None,
+                         help='Comma-separated problem sizes (default depends on the benchmark)')
+    optParser.add_option('-o', '--output', action='store', type='string',
+                         dest='output', default=None,
+                         help='Also write the results as JSON to this file')
+    opts, args = optParser.parse_args()
+    if opts.benchmark not in BENCHMARKS:
+        raise Exception('Unknown benchmark: ' + opts.benchmark)
+    return opts
+
+
+if __name__ == '__main__':
+    opts = parseOptions()
+    benchmark, defaultSizes = BENCHMARKS[opts.benchmark]
+    sizes = [int(size) for size in (opts.sizes or defaultSizes).split(',')]
+    print('Running benchmark %s' % opts.benchmark)
+    results = benchmark(sizes)
+    printResults(results)
+    if opts.output:
+        writeResults(results, opts.output)
@@ -182,7 +182,7 @@ class Application:
           simulation.SimulationEnvironment(self.robotEnvironment,agent)
         actionFn = lambda state: \
           self.robotEnvironment.getPossibleActions(state)
-        self.learner = qlearningAgents.QLearningAgent(actionFn=actionFn)
+        self.learner = qlearningAgents.QLearningAgent(actionFn=actionFn, table='dense')
 
         self.learner.setEpsilon(self.epsilon)
         self.learner.setLearningRate(self.alpha)
@@ -14,7 +14,6 @@
 
 import util
 from graphicsUtils import *
-from functools import reduce
 
 class GraphicsGridworldDisplay:
 
@@ -33,9 +32,13 @@ class GraphicsGridworldDisplay:
         values = util.Counter()
         policy = {}
         states = self.gridworld.getStates()
-        for state in states:
-            values[state] = agent.getValue(state)
-            policy[state] = agent.getPolicy(state)
+        if hasattr(agent, 'getValueTable'):
+            valueTable, policy = agent.getValueTable(states)
+            values.update(valueTable)
+        else:
+            for state in states:
+                values[state] = agent.getValue(state)
+                policy[state] = agent.getPolicy(state)
         drawValues(self.gridworld, values, policy, currentState, message)
         sleep(0.05 / self.speed)
 
@@ -53,9 +56,12 @@ class GraphicsGridworldDisplay:
     def displayQValues(self, agent, currentState = None, message = 'Agent Q-Values'):
         qValues = util.Counter()
         states = self.gridworld.getStates()
-        for state in states:
-            for action in self.gridworld.getPossibleActions(state):
-                qValues[(state, action)] = agent.getQValue(state, action)
+        if hasattr(agent, 'getQTable'):
+            qValues.update(agent.getQTable(states, self.gridworld.getPossibleActions))
+        else:
+            for state in states:
+                for action in self.gridworld.getPossibleActions(state):
+                    qValues[(state, action)] = agent.getQValue(state, action)
         drawQValues(self.gridworld, qValues, currentState, message)
         sleep(0.05 / self.speed)
 
@@ -132,8 +138,7 @@ def drawValues(gridworld, values, policy, currentState = None, message = 'State
 def drawQValues(gridworld, qValues, currentState = None, message = 'State-Action Q-Values'):
     grid = gridworld.grid
     blank()
-    stateCrossActions = [[(state, action) for action in gridworld.getPossibleActions(state)] for state in gridworld.getStates()]
-    qStates = reduce(lambda x,y: x+y, stateCrossActions, [])
+    qStates = [(state, action) for state in gridworld.getStates() for action in gridworld.getPossibleActions(state)]
     qValueList = [qValues[(state, action)] for state, action in qStates] + [0.0]
     minValue = min(qValueList)
     maxValue = max(qValueList)
@@ -12,6 +12,7 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import array
 import random
 import sys
 import mdp
@@ -32,6 +33,9 @@ class Gridworld(mdp.MarkovDecisionProcess):
         self.livingReward = 0.0
         self.noise = 0.2
 
+        # memoized results, see clearCache
+        self.clearCache()
+
     def setLivingReward(self, reward):
         """
         The (negative) reward for exiting "normal" states.
@@ -41,13 +45,32 @@ class Gridworld(mdp.MarkovDecisionProcess):
         future rewards.
         """
         self.livingReward = reward
+        self.clearCache()
 
     def setNoise(self, noise):
         """
         The probability of moving in an unintended direction.
         """
         self.noise = noise
+        self.clearCache()
+
 
+    def clearCache(self):
+        """
+        Drops every memoized result and bumps self.version.
+
+        States, actions, rewards and transitions are computed once per
+        version and then served from dictionaries.  setNoise and
+        setLivingReward call this; call it yourself after editing
+        self.grid in place.
+        """
+        mdp.MarkovDecisionProcess.clearCache(self)
+        self.version = getattr(self, 'version', -1) + 1
+        self.transitionCache = {}
+        self.actionCache = {}
+        self.rewardCache = {}
+        self.statesCache = None
+        self.startStateCache = None
 
     def getPossibleActions(self, state):
         """
@@ -57,6 +80,12 @@ class Gridworld(mdp.MarkovDecisionProcess):
         that "exit" states transition to the terminal
         state under the special action "done".
         """
+        actions = self.actionCache.get(state)
+        if actions is None:
+            actions = self.actionCache[state] = self.__getPossibleActions(state)
+        return actions
+
+    def __getPossibleActions(self, state):
         if state == self.grid.terminalState:
             return ()
         x,y = state
@@ -68,6 +97,11 @@ class Gridworld(mdp.MarkovDecisionProcess):
         """
         Return list of all states.
         """
+        if self.statesCache is None:
+            self.statesCache = self.__getStates()
+        return list(self.statesCache)
+
+    def __getStates(self):
         # The true terminal state.
         states = [self.grid.terminalState]
         for x in range(self.grid.width):
@@ -85,6 +119,12 @@ class Gridworld(mdp.MarkovDecisionProcess):
         departed (as in the R+N book examples, which more or
         less use this convention).
         """
+        reward = self.rewardCache.get(state)
+        if reward is None:
+            reward = self.rewardCache[state] = self.__getReward(state)
+        return reward
+
+    def __getReward(self, state):
         if state == self.grid.terminalState:
             return 0.0
         x, y = state
@@ -94,6 +134,11 @@ class Gridworld(mdp.MarkovDecisionProcess):
         return self.livingReward
 
     def getStartState(self):
+        if self.startStateCache is None:
+            self.startStateCache = self.__getStartState()
+        return self.startStateCache
+
+    def __getStartState(self):
         for x in range(self.grid.width):
             for y in range(self.grid.height):
                 if self.grid[x][y] == 'S':
@@ -118,7 +163,13 @@ class Gridworld(mdp.MarkovDecisionProcess):
         from 'state' by taking 'action' along
         with their transition probabilities.
         """
+        successors = self.transitionCache.get((state, action))
+        if successors is None:
+            successors = self.__getTransitionStatesAndProbs(state, action)
+            self.transitionCache[(state, action)] = successors
+        return list(successors)
 
+    def __getTransitionStatesAndProbs(self, state, action):
         if action not in self.getPossibleActions(state):
             raise Exception("Illegal action!")
 
@@ -162,6 +213,103 @@ class Gridworld(mdp.MarkovDecisionProcess):
 
         return successors
 
+    def compile(self, precision=None):
+        """
+        Builds the same CompiledMDP as MarkovDecisionProcess.compile, but
+        walks the grid once instead of going through the per-state
+        methods.  Successors are aggregated in the same order as
+        getTransitionStatesAndProbs so the probabilities match exactly.
+
+        With an array precision ('double' or 'single', see
+        mdp.MarkovDecisionProcess.compile) the states are not stored as
+        tuples either: states and stateIndex are a CellStates and a
+        CellStateIndex over one int per cell, which is what lets grids
+        of millions of cells fit in memory.
+        """
+        grid = self.grid
+        data = grid.data
+        width, height = grid.width, grid.height
+        terminalState = grid.terminalState
+        noise = self.noise
+        livingReward = self.livingReward
+
+        # Intern states in getStates() order: terminal first, then
+        # non-wall cells column by column.  cells[i] is x*height+y for
+        # state i and cellIds[x*height+y] the id of cell (x, y), with 0
+        # (the terminal's id) for walls.
+        if precision is None:
+            cells = [-1]
+            cellIds = [0] * (width * height)
+        else:
+            cells = array.array('i', [-1])
+            cellIds = array.array('i', [0]) * (width * height)
+        start = None
+        for x in range(width):
+            column = data[x]
+            for y in range(height):
+                cell = column[y]
+                if cell != '#':
+                    cellIds[x*height+y] = len(cells)
+                    if start is None and cell == 'S':
+                        start = len(cells)
+                    cells.append(x*height+y)
+        if precision is None:
+            states = [terminalState] + [divmod(c, height) for c in cells[1:]]
+            stateIndex = {}
+            for i, state in enumerate(states):
+                stateIndex[state] = i
+        else:
+            states = CellStates(cells, height, terminalState)
+            stateIndex = CellStateIndex(cellIds, width, height, terminalState)
+
+        terminal, actionStart, rowAction, rowStart, nextState, prob, reward = mdp.newColumns(precision)
+        terminal.append(True)
+        actionStart.append(0)
+        actionStart.append(0)
+        pMain, pSide = 1-noise, noise/2.0
+        for i in range(1, len(cells)):
+            code = cells[i]
+            x, y = divmod(code, height)
+            cell = data[x][y]
+            terminal.append(False)
+            if type(cell) == int or type(cell) == float:
+                for action in type(cell) == int and ('exit',) or ('north', 'west', 'south', 'east'):
+                    rowAction.append(action)
+                    rowStart.append(len(nextState))
+                    nextState.append(0)
+                    prob.append(1.0)
+                    reward.append(cell)
+            else:
+                n = y+1 < height and cellIds[code+1] or i
+                w = x > 0 and cellIds[code-height] or i
+                s = y > 0 and cellIds[code-1] or i
+                e = x+1 < width and cellIds[code+height] or i
+                for action, a, b, c in (('north', n, w, e), ('west', w, n, s),
+                                        ('south', s, w, e), ('east', e, n, s)):
+                    # a is the intended move, b and c the two slips.
+                    if a == b:
+                        if a == c:
+                            successors = ((a, pMain + pSide + pSide),)
+                        else:
+                            successors = ((a, pMain + pSide), (c, pSide))
+                    elif a == c:
+                        successors = ((a, pMain + pSide), (b, pSide))
+                    elif b == c:
+                        successors = ((a, pMain), (b, pSide + pSide))
+                    else:
+                        successors = ((a, pMain), (b, pSide), (c, pSide))
+                    rowAction.append(action)
+                    rowStart.append(len(nextState))
+                    for j, p in successors:
+                        nextState.append(j)
+                        prob.append(p)
+                        reward.append(livingReward)
+            actionStart.append(len(rowAction))
+        rowStart.append(len(nextState))
+
+        return mdp.CompiledMDP(states, stateIndex, terminal, start, actionStart,
+                               rowAction, rowStart, nextState, prob, reward, precision)
+
     def __aggregate(self, statesAndProbs):
         counter = util.Counter()
         for state, prob in statesAndProbs:
@@ -176,10 +324,72 @@ class Gridworld(mdp.MarkovDecisionProcess):
         if x < 0 or x >= self.grid.width: return False
         return self.grid[x][y] != '#'
 
+class CellStates:
+    """
+    The states of an array-backed compiled Gridworld, by id: id 0 is the
+    terminal state and id i > 0 is the cell (x, y) with
+    cells[i] == x*height+y.
+    """
+    def __init__(self, cells, height, terminalState):
+        self.cells = cells
+        self.height = height
+        self.terminalState = terminalState
+
+    def __getitem__(self, i):
+        if i == 0:
+            return self.terminalState
+        return divmod(self.cells[i], self.height)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        yield self.terminalState
+        height = self.height
+        for i in range(1, len(self.cells)):
+            yield divmod(self.cells[i], height)
+
+class CellStateIndex:
+    """
+    The inverse of CellStates: maps a state to its id through one int
+    per cell of the grid, cellIds[x*height+y], which is 0 for walls.
+    """
+    def __init__(self, cellIds, width, height, terminalState):
+        self.cellIds = cellIds
+        self.width = width
+        self.height = height
+        self.terminalState = terminalState
+
+    def get(self, state, default=None):
+        if state == self.terminalState:
+            return 0
+        try:
+            x, y = state
+        except (TypeError, ValueError):
+            return default
+        if 0 <= x < self.width and 0 <= y < self.height and self.cellIds[x*self.height+y]:
+            return self.cellIds[x*self.height+y]
+        return default
+
+    def __getitem__(self, state):
+        i = self.get(state)
+        if i is None:
+            raise KeyError(state)
+        return i
+
+    def __contains__(self, state):
+        return self.get(state) is not None
+
 class GridworldEnvironment(environment.Environment):
 
-    def __init__(self, gridWorld):
+    def __init__(self, gridWorld, compiled=None):
+        """
+        If compiled (a CompiledMDP of gridWorld, see Gridworld.compile) is
+        given, transitions are sampled from its arrays rather than
+        through gridWorld's methods.
+        """
         self.gridWorld = gridWorld
+        self.compiled = compiled
         self.reset()
 
     def getCurrentState(self):
@@ -200,6 +410,8 @@ class GridworldEnvironment(environment.Environment):
             rand = random.random()
         else:
             rand = randObj.random()
+        if self.compiled is not None:
+            return self.sampleCompiled(state, action, rand)
         sum = 0.0
         successors = self.gridWorld.getTransitionStatesAndProbs(state, action)
         for nextState, prob in successors:
@@ -211,6 +423,26 @@ class GridworldEnvironment(environment.Environment):
                 return (nextState, reward)
         raise Exception('Total transition probability less than one; sample failure.')
 
+    def sampleCompiled(self, state, action, rand):
+        """
+        getRandomNextState from the compiled arrays.  Successors are
+        walked in the same order, so the same random number picks the
+        same successor; in single precision the probabilities may sum to
+        slightly less than one, and the remainder goes to the last
+        successor.
+        """
+        compiled = self.compiled
+        r = compiled.findRow(compiled.stateIndex[state], action)
+        if r is None:
+            raise Exception("Illegal action!")
+        prob = compiled.prob
+        sum = 0.0
+        for k in compiled.getSuccessors(r):
+            sum += prob[k]
+            if rand < sum:
+                break
+        return (compiled.states[compiled.nextState[k]], compiled.reward[k])
+
     def reset(self):
         self.state = self.gridWorld.getStartState()
 
@@ -408,7 +640,7 @@ def parseOptions():
                          help='Request a window width of X pixels *per grid cell* (default %default)')
     optParser.add_option('-a', '--agent',action='store', metavar="A",
                          type='string',dest='agent',default="random",
-                         help='Agent type (options are \'random\', \'value\' and \'q\', default %default)')
+                         help='Agent type (options are \'random\', \'value\', \'policy\', \'topological\' and \'q\', default %default)')
     optParser.add_option('-t', '--text',action='store_true',
                          dest='textDisplay',default=False,
                          help='Use text-only ASCII display')
@@ -426,6 +658,21 @@ def parseOptions():
                          help='Manually control agent')
     optParser.add_option('-v', '--valueSteps',action='store_true' ,default=False,
                          help='Display each step of value iteration')
+    optParser.add_option('--table',action='store', metavar="T",
+                         type='string',dest='table',default='counter',
+                         help='Where q-learning keeps its Q-values, \'counter\' or \'dense\' (default %default)')
+    optParser.add_option('--planningSteps',action='store', metavar="K",
+                         type='int',dest='planningSteps',default=0,
+                         help='With -a q, make the agent Dyna-Q with K planning updates per step (default %default)')
+    optParser.add_option('--planning',action='store', metavar="P",
+                         type='string',dest='planning',default='random',
+                         help='Dyna-Q planning, \'random\' or \'prioritized\' (default %default)')
+    optParser.add_option('--lam',action='store', metavar="L",
+                         type='float',dest='lam',default=0.0,
+                         help='With -a q, learn through eligibility traces with this lambda (default %default)')
+    optParser.add_option('--traceMethod',action='store', metavar="M",
+                         type='string',dest='traceMethod',default='watkins',
+                         help='Eligibility trace method, \'watkins\' or \'sarsa\' (default %default)')
 
     opts, args = optParser.parse_args()
 
@@ -482,7 +729,8 @@ if __name__ == '__main__':
     import valueIterationAgents, qlearningAgents
     a = None
     if opts.agent == 'value':
-        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters)
+        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters,
+                                                     snapshots=opts.valueSteps and range(opts.iters) or None)
     elif opts.agent == 'q':
         #env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon
         #simulationFn = lambda agent, state: simulation.GridworldSimulation(agent,state,mdp)
@@ -491,8 +739,15 @@ if __name__ == '__main__':
         qLearnOpts = {'gamma': opts.discount,
                       'alpha': opts.learningRate,
                       'epsilon': opts.epsilon,
-                      'actionFn': actionFn}
-        a = qlearningAgents.QLearningAgent(**qLearnOpts)
+                      'actionFn': actionFn,
+                      'table': opts.table,
+                      'lam': opts.lam,
+                      'traceMethod': opts.traceMethod}
+        if opts.planningSteps > 0:
+            a = qlearningAgents.DynaQAgent(planningSteps=opts.planningSteps, planning=opts.planning,
+                                           **qLearnOpts)
+        else:
+            a = qlearningAgents.QLearningAgent(**qLearnOpts)
     elif opts.agent == 'random':
         # # No reason to use the random agent without episodes
         if opts.episodes == 0:
@@ -514,6 +769,10 @@ if __name__ == '__main__':
         a = valueIterationAgents.AsynchronousValueIterationAgent(mdp, opts.discount, opts.iters)
     elif opts.agent == 'priosweepvalue':
         a = valueIterationAgents.PrioritizedSweepingValueIterationAgent(mdp, opts.discount, opts.iters)
+    elif opts.agent == 'policy':
+        a = valueIterationAgents.PolicyIterationAgent(mdp, opts.discount, opts.iters)
+    elif opts.agent == 'topological':
+        a = valueIterationAgents.TopologicalValueIterationAgent(mdp, opts.discount, opts.iters)
     else:
         if not opts.manual: raise Exception('Unknown agent type: '+opts.agent)
 
@@ -523,10 +782,15 @@ if __name__ == '__main__':
     ###########################
     # DISPLAY Q/V VALUES BEFORE SIMULATION OF EPISODES
     try:
-        if not opts.manual and opts.agent in ('value', 'asynchvalue', 'priosweepvalue'):
+        if not opts.manual and opts.agent in ('value', 'asynchvalue', 'priosweepvalue', 'policy', 'topological'):
             if opts.valueSteps:
+                if opts.agent == 'value':
+                    stepper = a
+                else:
+                    stepper = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters,
+                                                                       snapshots=range(opts.iters))
                 for i in range(opts.iters):
-                    tempAgent = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, i)
+                    tempAgent = stepper.getSnapshot(i)
                     display.displayValues(tempAgent, message = "VALUES AFTER "+str(i)+" ITERATIONS")
                     display.pause()
 
@@ -545,7 +809,7 @@ if __name__ == '__main__':
         if opts.manual and opts.agent == None:
             displayCallback = lambda state: display.displayNullValues(state)
         else:
-            if opts.agent in ('random', 'value', 'asynchvalue', 'priosweepvalue'):
+            if opts.agent in ('random', 'value', 'asynchvalue', 'priosweepvalue', 'policy', 'topological'):
                 displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
             if opts.agent == 'q': displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES")
 
@@ -0,0 +1,104 @@
+# gridworldGenerator.py
+# ---------------------
+# Seeded generators for large gridworlds, for measuring how the MDP
+# code scales past the hand-written grids in gridworld.py.  Every
+# generator returns a gridworld.Gridworld with a start state 'S' and a
+# +10 exit; the same arguments always give the same grid.
+#
+#   maze   a perfect maze carved by depth-first search
+#   rooms  an open floor divided into rooms joined by doorways, with
+#          a few -10 pits
+#   cliff  CliffGrid stretched to the requested size
+
+
+import random
+
+import gridworld
+
+def getDimensions(cells):
+    "The width and height of a square grid with roughly this many cells."
+    side = max(3, int(round(cells ** 0.5)))
+    return side, side
+
+def getMaze(width, height, seed=0):
+    """
+    Passages sit on even coordinates and are joined by knocking out the
+    wall cell between them, so every open cell is reachable from the
+    start in the bottom left corner.
+    """
+    rand = random.Random(seed)
+    grid = gridworld.Grid(width, height, '#')
+    data = grid.data
+    data[0][0] = ' '
+    stack = [(0, 0)]
+    while stack:
+        x, y = stack[-1]
+        neighbours = [(x + dx, y + dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                      if 0 <= x + dx < width and 0 <= y + dy < height and data[x + dx][y + dy] == '#']
+        if not neighbours:
+            stack.pop()
+            continue
+        nx, ny = rand.choice(neighbours)
+        data[(x + nx) // 2][(y + ny) // 2] = ' '
+        data[nx][ny] = ' '
+        stack.append((nx, ny))
+    data[0][0] = 'S'
+    goalX, goalY = (width - 1) // 2 * 2, (height - 1) // 2 * 2
+    data[goalX][goalY] = 10
+    return gridworld.Gridworld(grid)
+
+def getRooms(width, height, seed=0, roomSize=8, pitFraction=0.005):
+    """
+    Walls every roomSize cells split the floor into rooms; each wall
+    between two neighbouring rooms has one doorway.
+    """
+    rand = random.Random(seed)
+    grid = gridworld.Grid(width, height, ' ')
+    data = grid.data
+    for wallY in range(roomSize, height - 1, roomSize + 1):
+        for x in range(width):
+            data[x][wallY] = '#'
+        for left in range(0, width, roomSize + 1):
+            right = min(left + roomSize, width) - 1
+            data[rand.randint(left, right)][wallY] = ' '
+    for wallX in range(roomSize, width - 1, roomSize + 1):
+        for y in range(height):
+            data[wallX][y] = '#'
+        for bottom in range(0, height, roomSize + 1):
+            top = min(bottom + roomSize, height) - 1
+            data[wallX][rand.randint(bottom, top)] = ' '
+    for i in range(int(width * height * pitFraction)):
+        x, y = rand.randrange(width), rand.randrange(height)
+        if data[x][y] == ' ':
+            data[x][y] = -10
+    data[0][0] = 'S'
+    data[width - 1][height - 1] = 10
+    return gridworld.Gridworld(grid)
+
+def getCliff(width, height, seed=0):
+    """
+    Like gridworld.getCliffGrid: a row of -100 cells along the bottom,
+    with the start and the +10 exit just above its two ends.
+    """
+    grid = gridworld.Grid(width, height, ' ')
+    for x in range(width):
+        grid.data[x][0] = -100
+    grid.data[0][1] = 'S'
+    grid.data[width - 1][1] = 10
+    return gridworld.Gridworld(grid)
+
+GENERATORS = {
+    'maze': getMaze,
+    'rooms': getRooms,
+    'cliff': getCliff,
+    }
+
+def generateGridworld(kind, cells, seed=0):
+    """
+    Returns a square gridworld of the given kind ('maze', 'rooms' or
+    'cliff') with about the given number of cells.
+    """
+    if kind not in GENERATORS:
+        raise Exception('Unknown gridworld kind: ' + kind)
+    width, height = getDimensions(cells)
+    return GENERATORS[kind](width, height, seed)
@@ -84,6 +84,37 @@ class ValueEstimationAgent(Agent):
         """
         util.raiseNotDefined()
 
+    ####################################
+    #    Bulk Queries                  #
+    ####################################
+    def getQTable(self, states, actionFn):
+        """
+        Returns a dict from (state, action) to Q(state,action) for every
+        state in states and every action in actionFn(state).
+
+        Displays and graders ask for whole tables at once through this
+        and getValueTable.  The defaults below just call getQValue,
+        getValue and getPolicy; agents that can answer a table in one
+        pass should override them.
+        """
+        qTable = {}
+        for state in states:
+            for action in actionFn(state):
+                qTable[(state, action)] = self.getQValue(state, action)
+        return qTable
+
+    def getValueTable(self, states):
+        """
+        Returns two dicts, from every state in states to V(state) and to
+        policy(state).
+        """
+        values = {}
+        policy = {}
+        for state in states:
+            values[state] = self.getValue(state)
+            policy[state] = self.getPolicy(state)
+        return values, policy
+
 class ReinforcementAgent(ValueEstimationAgent):
     """
       Abstract Reinforcemnt Agent: A ValueEstimationAgent
@@ -131,6 +162,35 @@ class ReinforcementAgent(ValueEstimationAgent):
         """
         self.episodeRewards += deltaReward
         self.update(state,action,nextState,deltaReward)
+        if self.replayBuffer is not None:
+            self.replayBuffer.push(state, action, nextState, deltaReward)
+            self.stepsSinceReplay += 1
+            if self.stepsSinceReplay >= self.replayPeriod and self.isInTraining():
+                self.stepsSinceReplay = 0
+                self.replay()
+
+    def replay(self):
+        """
+          Calls self.update on a minibatch of transitions drawn from the
+          replay buffer.  With prioritized replay, calls weightedUpdate
+          instead and feeds the TD errors back as new priorities.
+        """
+        if isinstance(self.replayBuffer, util.PrioritizedReplayBuffer):
+            slots, transitions, weights = self.replayBuffer.sample(self.replayBatchSize)
+            for slot, transition, weight in zip(slots, transitions, weights):
+                error = self.weightedUpdate(*(transition + (weight,)))
+                self.replayBuffer.updatePriority(slot, error)
+            return
+        for transition in self.replayBuffer.sample(self.replayBatchSize):
+            self.update(*transition)
+
+    def weightedUpdate(self, state, action, nextState, reward, weight):
+        """
+          Like update, with the step scaled by weight (an importance-
+          sampling weight from prioritized replay).  Returns the TD error
+          of the transition before the step.
+        """
+        util.raiseNotDefined()
 
     def startEpisode(self):
         """
@@ -160,7 +220,9 @@ class ReinforcementAgent(ValueEstimationAgent):
     def isInTesting(self):
         return not self.isInTraining()
 
-    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1,
+                 replayCapacity=0, replayBatchSize=32, replayRatio=1.0, priorityExponent=0,
+                 importanceExponent=0.4):
         """
         actionFn: Function which takes a state and returns the list of legal actions
 
@@ -168,6 +230,15 @@ class ReinforcementAgent(ValueEstimationAgent):
         epsilon  - exploration rate
         gamma    - discount factor
         numTraining - number of training episodes, i.e. no learning after these many episodes
+
+        With a replayCapacity, the last replayCapacity transitions are
+        kept in a util.ReplayBuffer and, during training, replayed:
+        every replayBatchSize / replayRatio steps the agent updates on a
+        minibatch of replayBatchSize transitions drawn from the buffer,
+        so replayRatio is the number of replayed updates per step, on top
+        of the update on each new transition.  A priorityExponent above 0
+        samples by TD error instead (see util.PrioritizedReplayBuffer),
+        which needs weightedUpdate.
         """
         if actionFn == None:
             actionFn = lambda state: state.getLegalActions()
@@ -179,6 +250,16 @@ class ReinforcementAgent(ValueEstimationAgent):
         self.epsilon = float(epsilon)
         self.alpha = float(alpha)
         self.discount = float(gamma)
+        self.replayBuffer = None
+        if int(replayCapacity) > 0:
+            if float(priorityExponent) > 0:
+                self.replayBuffer = util.PrioritizedReplayBuffer(int(replayCapacity), priorityExponent,
+                                                                 importanceExponent)
+            else:
+                self.replayBuffer = util.ReplayBuffer(int(replayCapacity))
+            self.replayBatchSize = int(replayBatchSize)
+            self.replayPeriod = max(1, int(round(self.replayBatchSize / float(replayRatio))))
+            self.stepsSinceReplay = 0
 
     ################################
     # Controls needed for Crawler  #
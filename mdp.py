@@ -12,8 +12,13 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import array
 import random
 
+# Typecodes of the float columns of an array-backed CompiledMDP, see
+# MarkovDecisionProcess.compile.
+PRECISIONS = {'double': 'd', 'single': 'f'}
+
 class MarkovDecisionProcess:
 
     def getStates(self):
@@ -65,3 +70,382 @@ class MarkovDecisionProcess:
         are equivalent.
         """
         abstract
+
+    def compile(self, precision=None):
+        """
+        Return a CompiledMDP: a tabular snapshot of this MDP in which
+        states are interned to integer ids and every transition is
+        stored in flat lists.
+
+        With precision=None the columns are Python lists, which are the
+        fastest to sweep.  precision='double' or 'single' stores them in
+        typed arrays instead (see newColumns), 64- or 32-bit floats for
+        probabilities and rewards, for MDPs too large to hold as lists.
+
+        This default builds the snapshot through the methods above, so it
+        works for any finite MDP; subclasses that know their own structure
+        can override it with something faster.  The snapshot is not
+        updated if the MDP changes afterwards.
+        """
+        states = self.getStates()
+        stateIndex = {}
+        for i, state in enumerate(states):
+            stateIndex[state] = i
+
+        terminal, actionStart, rowAction, rowStart, nextState, prob, reward = newColumns(precision)
+        for state in states:
+            terminal.append(self.isTerminal(state))
+            actionStart.append(len(rowAction))
+            for action in self.getPossibleActions(state):
+                rowAction.append(action)
+                rowStart.append(len(nextState))
+                for successor, p in self.getTransitionStatesAndProbs(state, action):
+                    nextState.append(stateIndex[successor])
+                    prob.append(p)
+                    reward.append(self.getReward(state, action, successor))
+        actionStart.append(len(rowAction))
+        rowStart.append(len(nextState))
+
+        start = stateIndex.get(self.getStartState())
+        return CompiledMDP(states, stateIndex, terminal, start, actionStart,
+                           rowAction, rowStart, nextState, prob, reward, precision)
+
+    def getPredecessors(self, state):
+        """
+        Return a list of (predecessor, action, prob) triples: every
+        non-terminal state and action that can reach 'state' with
+        positive probability.
+
+        The whole reverse-transition index is built on the first call
+        and cached on the MDP, so every agent working on the same MDP
+        shares it.  Call clearCache() after changing the dynamics.
+        """
+        return self.getPredecessorIndex()[0].get(state, [])
+
+    def getPredecessorStates(self, state):
+        """
+        Return the distinct predecessors of 'state' (see getPredecessors),
+        in getStates() order.
+        """
+        return self.getPredecessorIndex()[1].get(state, [])
+
+    def getPredecessorIndex(self):
+        index = getattr(self, 'predecessorIndex', None)
+        if index is None:
+            index = self.predecessorIndex = buildPredecessorIndex(self.compile())
+        return index
+
+    def clearCache(self):
+        """
+        Forget everything cached from the current dynamics (such as the
+        predecessor index).  Subclasses that let their dynamics change
+        must call this when they do.
+        """
+        self.predecessorIndex = None
+
+def buildPredecessorIndex(compiled):
+    """
+    Returns (predecessors, predecessorStates) for a CompiledMDP, as used
+    by MarkovDecisionProcess.getPredecessors and getPredecessorStates.
+    """
+    states, terminal = compiled.states, compiled.terminal
+    actionStart, rowAction, rowStart = compiled.actionStart, compiled.rowAction, compiled.rowStart
+    nextState, prob = compiled.nextState, compiled.prob
+    triples = [[] for i in range(compiled.numStates)]
+    distinct = [[] for i in range(compiled.numStates)]
+    for i in range(compiled.numStates):
+        if terminal[i]:
+            continue
+        state = states[i]
+        for r in range(actionStart[i], actionStart[i+1]):
+            for k in range(rowStart[r], rowStart[r+1]):
+                if prob[k] > 0:
+                    j = nextState[k]
+                    triples[j].append((state, rowAction[r], prob[k]))
+                    if len(distinct[j]) == 0 or distinct[j][-1] is not state:
+                        distinct[j].append(state)
+    predecessors = {}
+    predecessorStates = {}
+    for j, state in enumerate(states):
+        if triples[j]:
+            predecessors[state] = triples[j]
+            predecessorStates[state] = distinct[j]
+    return predecessors, predecessorStates
+
+def stronglyConnectedComponents(compiled):
+    """
+    Returns the strongly connected components of the transition graph of
+    a CompiledMDP as lists of state ids.  There is an edge from every
+    non-terminal state to each successor it reaches with positive
+    probability.  Every component comes after all the components it
+    can reach, so solving them in the order given only ever needs
+    values that are already final.
+
+    This is Tarjan's algorithm, run with an explicit stack so that long
+    corridors do not hit the recursion limit.
+    """
+    terminal, actionStart, rowStart = compiled.terminal, compiled.actionStart, compiled.rowStart
+    nextState, prob = compiled.nextState, compiled.prob
+
+    def successors(i):
+        if terminal[i]:
+            return
+        for k in range(rowStart[actionStart[i]], rowStart[actionStart[i+1]]):
+            if prob[k] > 0:
+                yield nextState[k]
+
+    numStates = compiled.numStates
+    index = [-1] * numStates
+    low = [0] * numStates
+    onStack = [False] * numStates
+    stack = []
+    components = []
+    counter = 0
+    for root in range(numStates):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = True
+        work = [(root, successors(root))]
+        while work:
+            i, remaining = work[-1]
+            for j in remaining:
+                if index[j] < 0:
+                    index[j] = low[j] = counter
+                    counter += 1
+                    stack.append(j)
+                    onStack[j] = True
+                    work.append((j, successors(j)))
+                    break
+                elif onStack[j] and index[j] < low[i]:
+                    low[i] = index[j]
+            else:
+                work.pop()
+                if work and low[i] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[i]
+                if low[i] == index[i]:
+                    component = []
+                    while True:
+                        j = stack.pop()
+                        onStack[j] = False
+                        component.append(j)
+                        if j == i:
+                            break
+                    component.sort()
+                    components.append(component)
+    return components
+
+def newColumns(precision=None):
+    """
+    Returns empty (terminal, actionStart, rowAction, rowStart, nextState,
+    prob, reward) columns for a CompiledMDP of the given precision.
+
+    For precision None these are plain lists.  Otherwise they are
+    array.arrays -- one byte per terminal flag, 32-bit ints for the ids
+    and offsets and PRECISIONS[precision] for prob and reward -- with
+    rowAction an ActionColumn.  Either way they are filled with append().
+    """
+    if precision is None:
+        return [], [], [], [], [], [], []
+    if precision not in PRECISIONS:
+        raise Exception('Unknown precision: ' + str(precision))
+    floatCode = PRECISIONS[precision]
+    return (array.array('b'), array.array('i'), ActionColumn(), array.array('i'),
+            array.array('i'), array.array(floatCode), array.array(floatCode))
+
+class ActionColumn:
+    """
+    The rowAction column of an array-backed CompiledMDP: one byte per
+    row, indexing a table of the distinct actions.
+    """
+    def __init__(self, codes=None, actions=()):
+        if codes is None:
+            codes = array.array('B')
+        self.codes = codes
+        self.actions = list(actions)
+        self.actionCode = {}
+        for code, action in enumerate(self.actions):
+            self.actionCode[action] = code
+
+    def append(self, action):
+        code = self.actionCode.get(action)
+        if code is None:
+            code = self.actionCode[action] = len(self.actions)
+            self.actions.append(action)
+        self.codes.append(code)
+
+    def __getitem__(self, r):
+        if isinstance(r, slice):
+            return [self.actions[code] for code in self.codes[r]]
+        return self.actions[self.codes[r]]
+
+    def __len__(self):
+        return len(self.codes)
+
+class StateVector:
+    """
+    A mapping from the states of a CompiledMDP to the entries of a
+    vector indexed by state id.  Agents use it in place of a util.Counter
+    for array-backed MDPs, where a dictionary entry per state would take
+    far more memory than the vector itself.  Like a Counter, states that
+    are not in the MDP read as 0.
+    """
+    def __init__(self, compiled, vector):
+        self.compiled = compiled
+        self.vector = vector
+
+    def get(self, state, default=None):
+        i = self.compiled.stateIndex.get(state)
+        if i is None:
+            return default
+        return self.vector[i]
+
+    def __getitem__(self, state):
+        return self.get(state, 0)
+
+    def __setitem__(self, state, value):
+        self.vector[self.compiled.stateIndex[state]] = value
+
+    def __contains__(self, state):
+        return state in self.compiled.stateIndex
+
+    def __len__(self):
+        return len(self.vector)
+
+    def __iter__(self):
+        return iter(self.compiled.states)
+
+    def keys(self):
+        return list(self.compiled.states)
+
+    def values(self):
+        return list(self.vector)
+
+    def items(self):
+        return list(zip(self.compiled.states, self.vector))
+
+class CompiledMDP(MarkovDecisionProcess):
+    """
+    A tabular MarkovDecisionProcess, usually produced by
+    MarkovDecisionProcess.compile().
+
+    States are numbered 0..numStates-1 in getStates() order and every
+    (state, action) pair is a numbered "row".  The transition model is
+    kept in parallel flat lists:
+
+      states[i]                         the state with id i
+      stateIndex[state]                 the id of state
+      terminal[i]                       whether state i is terminal
+      start                             the id of the start state
+      actionStart[i]..actionStart[i+1]  the rows of state i
+      rowAction[r]                      the action of row r
+      rowStart[r]..rowStart[r+1]        the successors of row r, given by
+      nextState, prob, reward           next state id, probability and reward
+
+    Rows and successors appear in the same order as getPossibleActions
+    and getTransitionStatesAndProbs return them, so results computed from
+    the arrays match results computed through the MDP methods exactly.
+
+    precision is None when the columns are lists, or 'double' / 'single'
+    when they are the typed arrays made by newColumns.  In 'single'
+    precision probabilities and rewards are rounded to 32-bit floats, so
+    results only agree with the MDP methods to about 7 digits.
+
+    A CompiledMDP also implements the MarkovDecisionProcess interface, so
+    it can be handed to any agent that expects an mdp.
+    """
+    def __init__(self, states, stateIndex, terminal, start, actionStart,
+                 rowAction, rowStart, nextState, prob, reward, precision=None):
+        self.states = states
+        self.stateIndex = stateIndex
+        self.terminal = terminal
+        self.start = start
+        self.actionStart = actionStart
+        self.rowAction = rowAction
+        self.rowStart = rowStart
+        self.nextState = nextState
+        self.prob = prob
+        self.reward = reward
+        self.precision = precision
+        self.numStates = len(states)
+        self.numRows = len(rowAction)
+
+    def getStateIndex(self, state):
+        return self.stateIndex[state]
+
+    def newVector(self, values=None):
+        """
+        Return a vector with one float per state id, holding values (an
+        iterable in state id order) or zeros: a list, or an array of the
+        same precision as prob and reward.
+        """
+        if self.precision is None:
+            if values is None:
+                return [0.0] * self.numStates
+            return list(values)
+        floatCode = PRECISIONS[self.precision]
+        if values is None:
+            return array.array(floatCode, [0.0]) * self.numStates
+        return array.array(floatCode, values)
+
+    def getRows(self, i):
+        """
+        Return the range of row ids for state id i.
+        """
+        return range(self.actionStart[i], self.actionStart[i+1])
+
+    def getSuccessors(self, r):
+        """
+        Return the range of successor entries for row id r.
+        """
+        return range(self.rowStart[r], self.rowStart[r+1])
+
+    def findRow(self, i, action):
+        """
+        Return the row id of action in state id i, or None if the
+        action is not legal there.
+        """
+        for r in range(self.actionStart[i], self.actionStart[i+1]):
+            if self.rowAction[r] == action:
+                return r
+        return None
+
+    # MarkovDecisionProcess interface
+
+    def getStates(self):
+        return list(self.states)
+
+    def getStartState(self):
+        if self.start is None:
+            raise Exception('Compiled MDP has no start state')
+        return self.states[self.start]
+
+    def getPossibleActions(self, state):
+        i = self.stateIndex[state]
+        return tuple(self.rowAction[self.actionStart[i]:self.actionStart[i+1]])
+
+    def getTransitionStatesAndProbs(self, state, action):
+        r = self.findRow(self.stateIndex[state], action)
+        if r is None:
+            raise Exception("Illegal action!")
+        states, nextState, prob = self.states, self.nextState, self.prob
+        return [(states[nextState[k]], prob[k]) for k in self.getSuccessors(r)]
+
+    def getReward(self, state, action, nextState):
+        r = self.findRow(self.stateIndex[state], action)
+        if r is not None:
+            j = self.stateIndex[nextState]
+            for k in self.getSuccessors(r):
+                if self.nextState[k] == j:
+                    return self.reward[k]
+        return 0.0
+
+    def isTerminal(self, state):
+        return bool(self.terminal[self.stateIndex[state]])
+
+    def compile(self, precision=None):
+        if precision is None or precision == self.precision:
+            return self
+        return MarkovDecisionProcess.compile(self, precision)
@@ -0,0 +1,135 @@
+# mdpFile.py
+# ----------
+# An on-disk format for mdp.CompiledMDP that is read back by memory
+# mapping, so any number of processes can share one read-only copy of a
+# large MDP: load() takes milliseconds whatever the size, and the
+# arrays live in the operating system's page cache rather than being
+# copied into each process's heap.
+#
+#   compiled = gridworldGenerator.generateGridworld('rooms', 10**6).compile('single')
+#   mdpFile.save(compiled, 'rooms.mdp')
+#   ...
+#   compiled = mdpFile.load('rooms.mdp')      # in every worker
+#
+# A file is an 8-byte magic string, the 8-byte length of a pickled
+# header, the header, and then one section per column, each aligned to
+# 8 bytes.  The header records where every section starts along with
+# the small tables (the actions, and the terminal state and size of a
+# gridworld).  Sections are written in native byte order, which the
+# header records, so files are meant for the machine that wrote them.
+#
+# The columns of a loaded MDP are memoryviews over the mapping; they
+# support the same indexing as the lists and arrays of mdp.py.
+# Compiled Gridworlds keep their compact state table (see
+# gridworld.CellStates).  The states of any other MDP are pickled into
+# the file and unpickled on load, so only the transitions are shared.
+
+
+import array
+import mmap
+import pickle
+import struct
+import sys
+
+import gridworld
+import mdp
+
+MAGIC = b'CMDP0001'
+
+def asColumn(column, typecode):
+    "Returns column as something with the buffer layout of array(typecode)."
+    if isinstance(column, array.array) and column.typecode == typecode:
+        return column
+    if isinstance(column, memoryview) and column.format == typecode:
+        return column
+    return array.array(typecode, column)
+
+def save(compiled, fileName):
+    """
+    Writes a CompiledMDP to fileName.  A list-backed MDP (precision None)
+    is written in double precision, which keeps every value exact.
+    """
+    precision = compiled.precision or 'double'
+    floatCode = mdp.PRECISIONS[precision]
+    rowAction = compiled.rowAction
+    if not isinstance(rowAction, mdp.ActionColumn):
+        rowAction = mdp.ActionColumn()
+        for action in compiled.rowAction:
+            rowAction.append(action)
+
+    sections = [('terminal', 'b', compiled.terminal),
+                ('actionStart', 'i', compiled.actionStart),
+                ('rowAction', 'B', rowAction.codes),
+                ('rowStart', 'i', compiled.rowStart),
+                ('nextState', 'i', compiled.nextState),
+                ('prob', floatCode, compiled.prob),
+                ('reward', floatCode, compiled.reward)]
+    header = {'byteorder': sys.byteorder, 'precision': precision, 'start': compiled.start,
+              'actions': rowAction.actions}
+    states = compiled.states
+    if isinstance(states, gridworld.CellStates):
+        cellIndex = compiled.stateIndex
+        header['grid'] = (cellIndex.width, cellIndex.height, cellIndex.terminalState)
+        sections.append(('cells', 'i', states.cells))
+        sections.append(('cellIds', 'i', cellIndex.cellIds))
+    else:
+        sections.append(('states', 'B', pickle.dumps(list(states), pickle.HIGHEST_PROTOCOL)))
+
+    columns = []
+    header['sections'] = {}
+    offset = 0
+    for name, typecode, column in sections:
+        column = asColumn(column, typecode)
+        size = len(column) * array.array(typecode).itemsize
+        header['sections'][name] = (typecode, offset, size)
+        columns.append(column)
+        offset += (size + 7) // 8 * 8
+
+    headerBytes = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    headerBytes += b'\0' * (-len(headerBytes) % 8)
+    with open(fileName, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack('<Q', len(headerBytes)))
+        handle.write(headerBytes)
+        for column in columns:
+            data = memoryview(column).cast('B')
+            handle.write(data)
+            handle.write(b'\0' * (-len(data) % 8))
+
+def load(fileName):
+    """
+    Maps fileName (written by save) read-only and returns a CompiledMDP
+    whose columns are views into the mapping.  The CompiledMDP remembers
+    fileName, so other processes can map the same file.
+    """
+    with open(fileName, 'rb') as handle:
+        mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapping[:8] != MAGIC:
+        raise Exception('Not a compiled MDP file: ' + fileName)
+    headerLength = struct.unpack('<Q', mapping[8:16])[0]
+    header = pickle.loads(mapping[16:16 + headerLength])
+    if header['byteorder'] != sys.byteorder:
+        raise Exception('Compiled MDP file has the wrong byte order: ' + fileName)
+
+    base = 16 + headerLength
+    buffer = memoryview(mapping)
+    columns = {}
+    for name, (typecode, offset, size) in header['sections'].items():
+        columns[name] = buffer[base + offset:base + offset + size].cast(typecode)
+
+    if 'grid' in header:
+        width, height, terminalState = header['grid']
+        states = gridworld.CellStates(columns['cells'], height, terminalState)
+        stateIndex = gridworld.CellStateIndex(columns['cellIds'], width, height, terminalState)
+    else:
+        states = pickle.loads(columns['states'])
+        stateIndex = {}
+        for i, state in enumerate(states):
+            stateIndex[state] = i
+
+    compiled = mdp.CompiledMDP(states, stateIndex, columns['terminal'], header['start'],
+                               columns['actionStart'], mdp.ActionColumn(columns['rowAction'], header['actions']),
+                               columns['rowStart'], columns['nextState'], columns['prob'],
+                               columns['reward'], header['precision'])
+    compiled.fileName = fileName
+    return compiled
@@ -0,0 +1,154 @@
+# parameterSweep.py
+# -----------------
+# Solves a gridworld for every combination of discount, noise and
+# living reward in a pool of worker processes and prints one line per
+# combination: the parameters, the value of the start state and the
+# resulting policy.  This is the brute-force way to explore questions
+# like those in analysis.py, e.g.
+#
+#   python parameterSweep.py -g DiscountGrid -d 0.1:0.9:0.2 -n 0,0.2 -r -1:0:0.5
+#
+# and, to keep only the settings whose policy matches a pattern,
+#
+#   python parameterSweep.py -g BridgeGrid -d 0.9 -n 0:0.2:0.01 -p '_______/_EEEEE_/_______'
+#
+# Policies are written one grid row per '/'-separated field, top row
+# first, with N, S, E, W for moves, X for exit and # for walls.  In a
+# pattern, _ matches anything.
+
+
+import multiprocessing
+import optparse
+
+import gridworld
+import valueIterationAgents
+
+POLICY_LETTERS = {'north': 'N', 'south': 'S', 'east': 'E', 'west': 'W', 'exit': 'X', None: '.'}
+
+# The gridworld of the current worker process, see initWorker.
+workerGrid = None
+
+def getGrid(gridName):
+    "Builds a gridworld from a name like 'BridgeGrid' or 'getBridgeGrid'."
+    if not gridName.startswith('get'):
+        gridName = 'get' + gridName
+    return getattr(gridworld, gridName)()
+
+def parseRange(text):
+    """
+    Parses either a comma-separated list of values ('0,0.2,0.5') or an
+    inclusive range 'start:stop:step' ('0.1:0.9:0.2').
+    """
+    if ':' not in text:
+        return [float(value) for value in text.split(',')]
+    start, stop, step = [float(value) for value in text.split(':')]
+    values = []
+    i = 0
+    while start + i * step <= stop + step * 1e-9:
+        values.append(round(start + i * step, 10))
+        i += 1
+    return values
+
+def initWorker(gridName):
+    global workerGrid
+    workerGrid = getGrid(gridName)
+
+def formatPolicy(grid, policy):
+    rows = []
+    for y in range(grid.grid.height - 1, -1, -1):
+        row = ''
+        for x in range(grid.grid.width):
+            if grid.grid[x][y] == '#':
+                row += '#'
+            else:
+                row += POLICY_LETTERS[policy[(x, y)]]
+        rows.append(row)
+    return '/'.join(rows)
+
+def matchesPolicy(policy, pattern):
+    if len(policy) != len(pattern):
+        return False
+    for letter, wanted in zip(policy, pattern):
+        if wanted != '_' and wanted != letter:
+            return False
+    return True
+
+def solveSetting(task):
+    """
+    Worker entry point.  A task is one (noise, livingReward) setting with
+    all of its discounts: the grid is compiled once for the setting and
+    every discount is solved against the same compiled arrays.
+    """
+    noise, livingReward, discounts, iterations, tolerance = task
+    workerGrid.setNoise(noise)
+    workerGrid.setLivingReward(livingReward)
+    compiled = workerGrid.compile()
+    start = workerGrid.getStartState()
+    results = []
+    for discount in discounts:
+        agent = valueIterationAgents.ValueIterationAgent(compiled, discount, iterations,
+                                                         engine='batched', tolerance=tolerance)
+        results.append((discount, noise, livingReward, agent.getValue(start),
+                        formatPolicy(workerGrid, agent.policy)))
+    return results
+
+def runSweep(gridName, discounts, noises, livingRewards, iterations=100, tolerance=None,
+             processes=None):
+    """
+    Returns a list of (discount, noise, livingReward, startValue, policy)
+    tuples, one per combination, ordered by noise, living reward and then
+    discount.  processes=1 solves everything in this process.
+    """
+    tasks = [(noise, livingReward, discounts, iterations, tolerance)
+             for noise in noises for livingReward in livingRewards]
+    if processes == 1:
+        initWorker(gridName)
+        batches = list(map(solveSetting, tasks))
+    else:
+        pool = multiprocessing.Pool(processes, initWorker, (gridName,))
+        try:
+            batches = pool.map(solveSetting, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return [row for batch in batches for row in batch]
+
+def parseOptions():
+    optParser = optparse.OptionParser()
+    optParser.add_option('-g', '--grid', action='store', type='string', dest='grid',
+                         default='DiscountGrid',
+                         help='Grid to use (for example BridgeGrid or getDiscountGrid, default %default)')
+    optParser.add_option('-d', '--discount', action='store', type='string', dest='discounts',
+                         default='0.1:0.9:0.1',
+                         help='Discounts as a list a,b,c or a range start:stop:step (default %default)')
+    optParser.add_option('-n', '--noise', action='store', type='string', dest='noises',
+                         default='0,0.2',
+                         help='Noise values, same format (default %default)')
+    optParser.add_option('-r', '--livingReward', action='store', type='string', dest='livingRewards',
+                         default='0',
+                         help='Living rewards, same format (default %default)')
+    optParser.add_option('-i', '--iterations', action='store', type='int', dest='iterations',
+                         default=100,
+                         help='Rounds of value iteration per setting (default %default)')
+    optParser.add_option('-t', '--tolerance', action='store', type='float', dest='tolerance',
+                         default=None,
+                         help='Stop each solve early once within this tolerance')
+    optParser.add_option('-j', '--processes', action='store', type='int', dest='processes',
+                         default=None,
+                         help='Worker processes (default: one per CPU)')
+    optParser.add_option('-p', '--policy', action='store', type='string', dest='policy',
+                         default=None,
+                         help='Only print settings whose policy matches this pattern')
+    opts, args = optParser.parse_args()
+    return opts
+
+
+if __name__ == '__main__':
+    opts = parseOptions()
+    rows = runSweep(opts.grid, parseRange(opts.discounts), parseRange(opts.noises),
+                    parseRange(opts.livingRewards), opts.iterations, opts.tolerance,
+                    opts.processes)
+    print('discount\tnoise\tliving\tstartValue\tpolicy')
+    for discount, noise, livingReward, startValue, policy in rows:
+        if opts.policy is None or matchesPolicy(policy, opts.policy):
+            print('%g\t%g\t%g\t%.4f\t%s' % (discount, noise, livingReward, startValue, policy))
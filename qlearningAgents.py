@@ -37,12 +37,41 @@ class QLearningAgent(ReinforcementAgent):
       Functions you should use
         - self.getLegalActions(state)
           which returns legal actions for a state
+
+      table selects where the Q-values are kept: 'counter' (a
+      util.Counter keyed by (state, action)) or 'dense' (a
+      util.DenseQTable, which interns states and actions to ids and
+      reads a state's Q-values as one row).  Both learn exactly the same
+      values.
+
+      With lam above 0 the agent learns from lambda-returns through
+      eligibility traces (see util.EligibilityTraces), so a reward
+      reaches back along the whole recent trajectory in one update.
+      traceMethod 'watkins' is Watkins's Q(lambda), which cuts the
+      traces whenever the agent takes a non-greedy action; 'sarsa' is
+      SARSA(lambda), whose update waits for the next action.  Traces
+      below traceCutoff are dropped.  Traces follow a single trajectory,
+      so they cannot be combined with experience replay.
     """
-    def __init__(self, **args):
+    def __init__(self, table='counter', lam=0, traceMethod='watkins', traceCutoff=0.01, **args):
         "You can initialize Q-values here..."
         ReinforcementAgent.__init__(self, **args)
 
-        "*** YOUR CODE HERE ***"
+        if table == 'counter':
+            self.qValues = util.Counter()
+        elif table == 'dense':
+            self.qValues = util.DenseQTable()
+        else:
+            raise Exception('Unknown Q-table: ' + table)
+        self.table = table
+        if traceMethod not in ('watkins', 'sarsa'):
+            raise Exception('Unknown trace method: ' + traceMethod)
+        self.lam = float(lam)
+        if self.lam > 0 and self.replayBuffer is not None:
+            raise Exception('Eligibility traces cannot be combined with experience replay')
+        self.traceMethod = traceMethod
+        self.traces = util.EligibilityTraces(traceCutoff)
+        self.pendingTransition = None
 
     def getQValue(self, state, action):
         """
@@ -50,9 +79,16 @@ class QLearningAgent(ReinforcementAgent):
           Should return 0.0 if we have never seen a state
           or the Q node value otherwise
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.qValues[(state, action)]
 
+    def getQValues(self, state, actions):
+        """
+          [Q(state,action) for action in actions], read as one row of a
+          dense table.
+        """
+        if self.table == 'dense':
+            return self.qValues.getRow(state, actions)
+        return [self.getQValue(state, action) for action in actions]
 
     def computeValueFromQValues(self, state):
         """
@@ -61,8 +97,10 @@ class QLearningAgent(ReinforcementAgent):
           there are no legal actions, which is the case at the
           terminal state, you should return a value of 0.0.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        actions = self.getLegalActions(state)
+        if len(actions) == 0:
+            return 0.0
+        return max(self.getQValues(state, actions))
 
     def computeActionFromQValues(self, state):
         """
@@ -70,8 +108,13 @@ class QLearningAgent(ReinforcementAgent):
           are no legal actions, which is the case at the terminal state,
           you should return None.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        actions = self.getLegalActions(state)
+        if len(actions) == 0:
+            return None
+        qValues = self.getQValues(state, actions)
+        bestValue = max(qValues)
+        return random.choice([action for action, qValue in zip(actions, qValues)
+                              if qValue == bestValue])
 
     def getAction(self, state):
         """
@@ -87,8 +130,15 @@ class QLearningAgent(ReinforcementAgent):
         # Pick Action
         legalActions = self.getLegalActions(state)
         action = None
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        if len(legalActions) == 0:
+            return action
+        explored = util.flipCoin(self.epsilon)
+        if explored:
+            action = random.choice(legalActions)
+        else:
+            action = self.computeActionFromQValues(state)
+        if self.lam > 0:
+            self.finishTraceUpdate(state, action, explored)
 
         return action
 
@@ -101,8 +151,60 @@ class QLearningAgent(ReinforcementAgent):
           NOTE: You should never call this function,
           it will be called on your behalf
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        if self.lam > 0:
+            self.updateTraces(state, action, nextState, reward)
+            return
+        sample = reward + self.discount * self.computeValueFromQValues(nextState)
+        self.qValues[(state, action)] = ((1 - self.alpha) * self.getQValue(state, action)
+                                         + self.alpha * sample)
+
+    def updateTraces(self, state, action, nextState, reward):
+        """
+          The lambda-return form of update.  SARSA(lambda) needs the action
+          taken in nextState, so unless nextState is terminal the
+          transition waits for getAction to finish it.
+        """
+        if self.traceMethod == 'sarsa' and len(self.getLegalActions(nextState)) > 0:
+            self.pendingTransition = (state, action, nextState, reward)
+            return
+        self.traceStep(state, action, reward + self.discount * self.computeValueFromQValues(nextState))
+
+    def finishTraceUpdate(self, state, action, explored):
+        """
+          Called by getAction once it has chosen action in state: finishes
+          a waiting SARSA(lambda) update, or for Q(lambda) cuts the traces
+          if action is not greedy.
+        """
+        if self.pendingTransition is not None:
+            lastState, lastAction, nextState, reward = self.pendingTransition
+            self.pendingTransition = None
+            self.traceStep(lastState, lastAction, reward + self.discount * self.getQValue(state, action))
+        elif self.traceMethod == 'watkins' and explored:
+            if self.getQValue(state, action) < self.computeValueFromQValues(state):
+                self.traces.clear()
+
+    def traceStep(self, state, action, target):
+        """
+          Moves every traced Q-value towards target in proportion to its
+          trace, after setting the trace of (state, action) to 1.
+        """
+        qValues = self.qValues
+        step = self.alpha * (target - self.getQValue(state, action))
+        self.traces.replace((state, action))
+        for key, trace in self.traces.items():
+            qValues[key] = qValues[key] + step * trace
+        self.traces.decay(self.discount * self.lam)
+
+    def startEpisode(self):
+        ReinforcementAgent.startEpisode(self)
+        self.traces.clear()
+        self.pendingTransition = None
+
+    def weightedUpdate(self, state, action, nextState, reward, weight):
+        qValue = self.getQValue(state, action)
+        error = reward + self.discount * self.computeValueFromQValues(nextState) - qValue
+        self.qValues[(state, action)] = qValue + self.alpha * weight * error
+        return error
 
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
@@ -110,6 +212,152 @@ class QLearningAgent(ReinforcementAgent):
     def getValue(self, state):
         return self.computeValueFromQValues(state)
 
+    def getQTable(self, states, actionFn):
+        "Reads the table directly, without adding unseen pairs to it."
+        qValues = self.qValues
+        qTable = {}
+        for state in states:
+            for action in actionFn(state):
+                qTable[(state, action)] = qValues.get((state, action), 0)
+        return qTable
+
+    def getValueTable(self, states):
+        """
+          Values and policy from one getQTable pass, so every Q-value is
+          computed once.  Ties are broken with random.choice exactly as in
+          computeActionFromQValues.
+        """
+        qTable = self.getQTable(states, self.getLegalActions)
+        values = {}
+        policy = {}
+        for state in states:
+            actions = self.getLegalActions(state)
+            if len(actions) == 0:
+                values[state] = 0.0
+                policy[state] = None
+                continue
+            qValues = [qTable[(state, action)] for action in actions]
+            bestValue = max(qValues)
+            values[state] = bestValue
+            policy[state] = random.choice([action for action, qValue in zip(actions, qValues)
+                                           if qValue == bestValue])
+        return values, policy
+
+
+class DynaQAgent(QLearningAgent):
+    """
+      Dyna-Q: a QLearningAgent that also learns a model of the
+      environment from the transitions it observes, and after every real
+      step makes planningSteps more Q-learning updates on transitions
+      simulated from that model.
+
+      model is 'stochastic' (next states and rewards are drawn in
+      proportion to how often each was observed after the state and
+      action) or 'deterministic' (the last one observed is replayed).
+      planning is 'random' (simulate from uniformly chosen observed
+      state-action pairs) or 'prioritized' (prioritized sweeping: pairs
+      wait in a queue ordered by the size of their last TD error, and
+      updating a pair queues the pairs observed to lead into its state,
+      if their TD error is above theta).
+
+      Planning already replays what the model has seen, so neither
+      eligibility traces (lam) nor a replayCapacity may be given.
+    """
+    def __init__(self, planningSteps=5, model='stochastic', planning='random', theta=1e-4, **args):
+        QLearningAgent.__init__(self, **args)
+        if self.lam > 0:
+            raise Exception('Dyna-Q planning cannot be combined with eligibility traces')
+        if self.replayBuffer is not None:
+            raise Exception('Dyna-Q planning cannot be combined with experience replay')
+        if model not in ('stochastic', 'deterministic'):
+            raise Exception('Unknown Dyna model: ' + model)
+        if planning not in ('random', 'prioritized'):
+            raise Exception('Unknown Dyna planning: ' + planning)
+        self.planningSteps = int(planningSteps)
+        self.model = model
+        self.planning = planning
+        self.theta = float(theta)
+        self.outcomes = {}
+        self.observedPairs = []
+        self.predecessors = {}
+        self.planningQueue = util.IndexedPriorityQueue()
+
+    def update(self, state, action, nextState, reward):
+        """
+          The Q-learning update on the real transition, then recording it
+          in the model, then planning.
+        """
+        QLearningAgent.update(self, state, action, nextState, reward)
+        self.recordTransition(state, action, nextState, reward)
+        if self.isInTraining():
+            if self.planning == 'prioritized':
+                self.queuePair(state, action)
+                self.planPrioritized()
+            else:
+                self.planRandom()
+
+    def recordTransition(self, state, action, nextState, reward):
+        """
+          Adds a transition to the model: a dict from (state, action) to
+          a dict from (nextState, reward) to its count, which is only ever
+          one entry for a deterministic model.  The pairs leading into
+          each state are kept as the keys of a dict, in the order first
+          observed, so prioritized planning does not depend on hashing.
+        """
+        pair = (state, action)
+        outcomes = self.outcomes.get(pair)
+        if outcomes is None:
+            outcomes = self.outcomes[pair] = {}
+            self.observedPairs.append(pair)
+        outcome = (nextState, reward)
+        if self.model == 'deterministic':
+            outcomes.clear()
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        self.predecessors.setdefault(nextState, {})[pair] = None
+
+    def simulate(self, state, action):
+        "A (nextState, reward) drawn from the model for an observed pair"
+        outcomes = self.outcomes[(state, action)]
+        if len(outcomes) == 1:
+            for outcome in outcomes:
+                return outcome
+        point = random.random() * sum(outcomes.values())
+        for outcome, count in outcomes.items():
+            point -= count
+            if point < 0:
+                return outcome
+        return outcome
+
+    def planRandom(self):
+        for i in range(self.planningSteps):
+            state, action = random.choice(self.observedPairs)
+            nextState, reward = self.simulate(state, action)
+            QLearningAgent.update(self, state, action, nextState, reward)
+
+    def queuePair(self, state, action):
+        """
+          Queues an observed pair if the TD error of its expected outcome
+          under the model is above theta.
+        """
+        outcomes = self.outcomes[(state, action)]
+        target = 0.0
+        for (nextState, reward), count in outcomes.items():
+            target += count * (reward + self.discount * self.computeValueFromQValues(nextState))
+        error = abs(target / sum(outcomes.values()) - self.getQValue(state, action))
+        if error > self.theta:
+            self.planningQueue.update((state, action), -error)
+
+    def planPrioritized(self):
+        queue = self.planningQueue
+        for i in range(self.planningSteps):
+            if queue.isEmpty():
+                break
+            state, action = queue.pop()
+            nextState, reward = self.simulate(state, action)
+            QLearningAgent.update(self, state, action, nextState, reward)
+            for predecessor, predecessorAction in self.predecessors.get(state, ()):
+                self.queuePair(predecessor, predecessorAction)
+
 
 class PacmanQAgent(QLearningAgent):
     "Exactly the same as QLearningAgent, but with different default parameters"
@@ -143,6 +391,26 @@ class PacmanQAgent(QLearningAgent):
         return action
 
 
+class PacmanDynaQAgent(DynaQAgent):
+    """
+    DynaQAgent with the defaults of PacmanQAgent, for example
+        python pacman.py -p PacmanDynaQAgent -x 2000 -n 2010 -l smallGrid -a planningSteps=10
+    """
+
+    def __init__(self, epsilon=0.05,gamma=0.8,alpha=0.2, numTraining=0, **args):
+        args['epsilon'] = epsilon
+        args['gamma'] = gamma
+        args['alpha'] = alpha
+        args['numTraining'] = numTraining
+        self.index = 0  # This is always Pacman
+        DynaQAgent.__init__(self, **args)
+
+    def getAction(self, state):
+        action = DynaQAgent.getAction(self,state)
+        self.doAction(state,action)
+        return action
+
+
 class ApproximateQAgent(PacmanQAgent):
     """
        ApproximateQLearningAgent
@@ -164,15 +432,55 @@ class ApproximateQAgent(PacmanQAgent):
           Should return Q(state,action) = w * featureVector
           where * is the dotProduct operator
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.weights * self.featExtractor.getFeatures(state, action)
+
+    def getQValues(self, state, actions):
+        "Always through getQValue: the weights, not a table, hold Q."
+        return [self.getQValue(state, action) for action in actions]
+
+    def getQTable(self, states, actionFn):
+        """
+          w * featureVector for every pair, extracting the features of
+          each pair once; getValueTable derives the values and policy
+          from this table instead of extracting them again.
+        """
+        weights = self.getWeights()
+        getFeatures = self.featExtractor.getFeatures
+        qTable = {}
+        for state in states:
+            for action in actionFn(state):
+                qTable[(state, action)] = weights * getFeatures(state, action)
+        return qTable
 
     def update(self, state, action, nextState, reward):
         """
            Should update your weights based on transition
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        if self.lam > 0:
+            self.updateTraces(state, action, nextState, reward)
+            return
+        self.weightedUpdate(state, action, nextState, reward, 1.0)
+
+    def traceStep(self, state, action, target):
+        """
+          Traces are kept per feature and accumulate the feature values;
+          every traced weight moves in proportion to its trace.
+        """
+        features = self.featExtractor.getFeatures(state, action)
+        step = self.alpha * (target - self.weights * features)
+        for feature, value in features.items():
+            self.traces.add(feature, value)
+        for feature, trace in self.traces.items():
+            self.weights[feature] += step * trace
+        self.traces.decay(self.discount * self.lam)
+
+    def weightedUpdate(self, state, action, nextState, reward, weight):
+        features = self.featExtractor.getFeatures(state, action)
+        difference = (reward + self.discount * self.computeValueFromQValues(nextState)
+                      - self.weights * features)
+        for feature, value in features.items():
+            self.weights[feature] += self.alpha * weight * difference * value
+        return difference
 
     def final(self, state):
         "Called at the end of each game."
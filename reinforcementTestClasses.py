@@ -13,8 +13,8 @@
 
 
 import testClasses
-import random, math, traceback, sys, os
-import layout, textDisplay, pacman, gridworld
+import random, math, traceback, sys, os, tempfile, ast
+import layout, textDisplay, pacman, gridworld, gridworldGenerator, mdpFile
 import time
 from util import Counter, TimeoutFunction, FixedRandom, Experiences
 from collections import defaultdict
@@ -55,9 +55,10 @@ class ValueIterationTest(testClasses.TestCase):
     def execute(self, grades, moduleDict, solutionDict):
         failureOutputFileString = ''
         failureOutputStdString = ''
+        agents = self.makeAgents(moduleDict)
         for n in self.numsIterationsForDisplay:
             checkPolicy = (n == self.numsIterationsForDisplay[-1])
-            testPass, stdOutString, fileOutString = self.executeNIterations(grades, moduleDict, solutionDict, n, checkPolicy)
+            testPass, stdOutString, fileOutString = self.executeNIterations(grades, agents[n], solutionDict, n, checkPolicy)
             failureOutputStdString += stdOutString
             failureOutputFileString += fileOutString
             if not testPass:
@@ -68,9 +69,9 @@ class ValueIterationTest(testClasses.TestCase):
         self.removeFailureFileIfExists()
         return self.testPass(grades)
 
-    def executeNIterations(self, grades, moduleDict, solutionDict, n, checkPolicy):
+    def executeNIterations(self, grades, agent, solutionDict, n, checkPolicy):
         testPass = True
-        valuesPretty, qValuesPretty, actions, policyPretty = self.runAgent(moduleDict, n)
+        valuesPretty, qValuesPretty, actions, policyPretty = self.runAgent(agent)
         stdOutString = ''
         fileOutString = ''
         valuesKey = "values_k_%d" % n
@@ -105,14 +106,45 @@ class ValueIterationTest(testClasses.TestCase):
                 outString += "   Correct solution:\n %s\n" % self.prettyValueSolutionString('policy', solutionDict['policy'])
                 stdOutString += outString
                 fileOutString += outString
+            mismatches = self.checkBulkTables(agent)
+            if mismatches:
+                testPass = False
+                outString = "getQTable/getValueTable at iteration %d disagree with computeQValueFromValues/computeActionFromValues:\n" % n
+                outString += ''.join(['    %s\n' % mismatch for mismatch in mismatches])
+                stdOutString += outString
+                fileOutString += outString
         return testPass, stdOutString, fileOutString
 
+    def checkBulkTables(self, agent):
+        """
+        runAgent reads the agent through its bulk getQTable and
+        getValueTable, so compare those with computeQValueFromValues and
+        computeActionFromValues for every (state, action) pair.  Returns a
+        description of each pair that differs.
+        """
+        states = self.grid.getStates()
+        values, policy = agent.getValueTable(states)
+        qTable = agent.getQTable(states, self.grid.getPossibleActions)
+        mismatches = []
+        for state in states:
+            for action in self.grid.getPossibleActions(state):
+                expected = agent.computeQValueFromValues(state, action)
+                if abs(qTable[(state, action)] - expected) > 1e-9:
+                    mismatches.append('Q%s: getQTable %r, computeQValueFromValues %r' %
+                                      ((state, action), qTable[(state, action)], expected))
+            expected = agent.computeActionFromValues(state)
+            if policy[state] != expected:
+                mismatches.append('policy at %s: getValueTable %r, computeActionFromValues %r' %
+                                  (state, policy[state], expected))
+        return mismatches
+
     def writeSolution(self, moduleDict, filePath):
         with open(filePath, 'w') as handle:
             policyPretty = ''
             actions = []
+            agents = self.makeAgents(moduleDict)
             for n in self.numsIterationsForDisplay:
-                valuesPretty, qValuesPretty, actions, policyPretty = self.runAgent(moduleDict, n)
+                valuesPretty, qValuesPretty, actions, policyPretty = self.runAgent(agents[n])
                 handle.write(self.prettyValueSolutionString('values_k_%d' % n, valuesPretty))
                 for action in actions:
                     handle.write(self.prettyValueSolutionString('q_values_k_%d_action_%s' % (n, action), qValuesPretty[action]))
@@ -120,24 +152,28 @@ class ValueIterationTest(testClasses.TestCase):
             handle.write(self.prettyValueSolutionString('actions', '\n'.join(actions) + '\n'))
         return True
 
-    def runAgent(self, moduleDict, numIterations):
-        agent = moduleDict['valueIterationAgents'].ValueIterationAgent(self.grid, discount=self.discount, iterations=numIterations)
+    def makeAgents(self, moduleDict):
+        """
+        Returns {n: the agent after n iterations} for every n in
+        numsIterationsForDisplay, all from one value iteration run that
+        snapshots its values at those iteration counts.
+        """
+        nums = self.numsIterationsForDisplay
+        agent = moduleDict['valueIterationAgents'].ValueIterationAgent(self.grid, discount=self.discount,
+                                                                       iterations=max(nums), snapshots=nums)
+        return dict((n, agent.getSnapshot(n)) for n in nums)
+
+    def runAgent(self, agent):
         states = self.grid.getStates()
         actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
-        values = {}
+        values, policy = agent.getValueTable(states)
         qValues = {}
-        policy = {}
+        qTable = agent.getQTable(states, self.grid.getPossibleActions)
         for state in states:
-            values[state] = agent.getValue(state)
-            policy[state] = agent.computeActionFromValues(state)
-            possibleActions = self.grid.getPossibleActions(state)
             for action in actions:
                 if action not in qValues:
                     qValues[action] = {}
-                if action in possibleActions:
-                    qValues[action][state] = agent.computeQValueFromValues(state, action)
-                else:
-                    qValues[action][state] = None
+                qValues[action][state] = qTable.get((state, action))
         valuesPretty = self.prettyValues(values)
         policyPretty = self.prettyPolicy(policy)
         qValuesPretty = {}
@@ -197,56 +233,207 @@ class ValueIterationTest(testClasses.TestCase):
 
 
 class AsynchronousValueIterationTest(ValueIterationTest):
-    def runAgent(self, moduleDict, numIterations):
-        agent = moduleDict['valueIterationAgents'].AsynchronousValueIterationAgent(self.grid, discount=self.discount, iterations=numIterations)
-        states = self.grid.getStates()
-        actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
-        values = {}
-        qValues = {}
-        policy = {}
-        for state in states:
-            values[state] = agent.getValue(state)
-            policy[state] = agent.computeActionFromValues(state)
-            possibleActions = self.grid.getPossibleActions(state)
-            for action in actions:
-                if action not in qValues:
-                    qValues[action] = {}
-                if action in possibleActions:
-                    qValues[action][state] = agent.computeQValueFromValues(state, action)
-                else:
-                    qValues[action][state] = None
-        valuesPretty = self.prettyValues(values)
-        policyPretty = self.prettyPolicy(policy)
-        qValuesPretty = {}
-        for action in actions:
-            qValuesPretty[action] = self.prettyValues(qValues[action])
-        return (valuesPretty, qValuesPretty, actions, policyPretty)
+    def makeAgents(self, moduleDict):
+        agents = {}
+        for n in self.numsIterationsForDisplay:
+            agents[n] = moduleDict['valueIterationAgents'].AsynchronousValueIterationAgent(self.grid, discount=self.discount, iterations=n)
+        return agents
 
 class PrioritizedSweepingValueIterationTest(ValueIterationTest):
-    def runAgent(self, moduleDict, numIterations):
-        agent = moduleDict['valueIterationAgents'].PrioritizedSweepingValueIterationAgent(self.grid, discount=self.discount, iterations=numIterations)
+    def makeAgents(self, moduleDict):
+        agents = {}
+        for n in self.numsIterationsForDisplay:
+            agents[n] = moduleDict['valueIterationAgents'].PrioritizedSweepingValueIterationAgent(self.grid, discount=self.discount, iterations=n)
+        return agents
+
+class ResumedValueIterationTest(testClasses.TestCase):
+    """
+    Checks that a cyclic value iteration run that is stopped after every
+    update (timeBudget 0), resumed, and every few stops written to and
+    reloaded from a checkpoint, ends exactly where an uninterrupted run
+    with the same tolerance does.
+    """
+
+    def __init__(self, question, testDict):
+        super(ResumedValueIterationTest, self).__init__(question, testDict)
+        self.discount = float(testDict['discount'])
+        self.grid = gridworld.Gridworld(parseGrid(testDict['grid']))
+        if 'noise' in testDict: self.grid.setNoise(float(testDict['noise']))
+        if 'livingReward' in testDict: self.grid.setLivingReward(float(testDict['livingReward']))
+        self.iterations = int(testDict['valueIterations'])
+        self.tolerance = float(testDict['tolerance'])
+        self.checkpointEvery = int(testDict.get('checkpointEvery', '10'))
+
+    def execute(self, grades, moduleDict, solutionDict):
+        agentClass = moduleDict['valueIterationAgents'].AsynchronousValueIterationAgent
+        whole = agentClass(self.grid, discount=self.discount, iterations=self.iterations, tolerance=self.tolerance)
+        resumed = agentClass(self.grid, discount=self.discount, iterations=self.iterations,
+                             tolerance=self.tolerance, timeBudget=0)
+        handle, fileName = tempfile.mkstemp(suffix='.pkl')
+        os.close(handle)
+        try:
+            stops = 0
+            while not resumed.stats.converged and resumed.completedIterations < self.iterations:
+                if not resumed.stats.timedOut:
+                    self.addMessage('Run with timeBudget 0 stopped without timing out')
+                    return self.testFail(grades)
+                stops += 1
+                if stops % self.checkpointEvery == 0:
+                    resumed.saveCheckpoint(fileName)
+                    resumed.loadCheckpoint(fileName)
+                resumed.resume()
+        finally:
+            os.remove(fileName)
+
         states = self.grid.getStates()
-        actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
-        values = {}
-        qValues = {}
-        policy = {}
+        mismatches = []
+        for name, wholeValue, resumedValue in [
+                ('completedIterations', whole.completedIterations, resumed.completedIterations),
+                ('backups', whole.stats.backups, resumed.stats.backups),
+                ('residuals', whole.stats.residuals, resumed.stats.residuals),
+                ('converged', whole.stats.converged, resumed.stats.converged),
+                ('values', [whole.getValue(state) for state in states],
+                           [resumed.getValue(state) for state in states])]:
+            if wholeValue != resumedValue:
+                mismatches.append('%s: uninterrupted %s, resumed %s' % (name, wholeValue, resumedValue))
+        if mismatches:
+            self.addMessage('Resumed run (%d stops) differs from the uninterrupted run:' % stops)
+            for mismatch in mismatches:
+                self.addMessage('    ' + mismatch)
+            return self.testFail(grades)
+        return self.testPass(grades)
+
+    def writeSolution(self, moduleDict, filePath):
+        with open(filePath, 'w') as handle:
+            handle.write('# This is the solution file for %s.\n' % self.path)
+            handle.write('# File intentionally blank.\n')
+        return True
+
+class OptimalValueTest(testClasses.TestCase):
+    """
+    Runs a value iteration agent class from valueIterationAgents with the
+    given agentArgs and checks it against optimal values, worked out by
+    ValueIterationAgent to a tenth of the tolerance: the agent must
+    report convergence, its values must be within tolerance of optimal,
+    and the optimal Q-value of its policy's action within tolerance of
+    the optimal value.  checkStates is 'all' or 'start' (for agents that
+    only solve the states reachable from the start).
+    """
+
+    def __init__(self, question, testDict):
+        super(OptimalValueTest, self).__init__(question, testDict)
+        self.discount = float(testDict['discount'])
+        self.grid = getTestGrid(testDict)
+        self.agentName = testDict['agent']
+        self.agentArgs = parseTestArgs(testDict.get('agentArgs', ''))
+        self.tolerance = float(testDict['tolerance'])
+        self.checkStates = testDict.get('checkStates', 'all')
+
+    def execute(self, grades, moduleDict, solutionDict):
+        module = moduleDict['valueIterationAgents']
+        optimal = module.ValueIterationAgent(self.grid, discount=self.discount, iterations=100000,
+                                             engine='batched', tolerance=self.tolerance / 10)
+        agent = getattr(module, self.agentName)(self.grid, discount=self.discount, **self.agentArgs)
+        if self.checkStates == 'start':
+            states = [self.grid.getStartState()]
+        else:
+            states = self.grid.getStates()
+
+        messages = []
+        if not agent.stats.converged:
+            messages.append('%s did not converge: %s' % (self.agentName, agent.stats))
         for state in states:
-            values[state] = agent.getValue(state)
-            policy[state] = agent.computeActionFromValues(state)
-            possibleActions = self.grid.getPossibleActions(state)
-            for action in actions:
-                if action not in qValues:
-                    qValues[action] = {}
-                if action in possibleActions:
-                    qValues[action][state] = agent.computeQValueFromValues(state, action)
-                else:
-                    qValues[action][state] = None
-        valuesPretty = self.prettyValues(values)
-        policyPretty = self.prettyPolicy(policy)
-        qValuesPretty = {}
-        for action in actions:
-            qValuesPretty[action] = self.prettyValues(qValues[action])
-        return (valuesPretty, qValuesPretty, actions, policyPretty)
+            value, optimalValue = agent.getValue(state), optimal.getValue(state)
+            if abs(value - optimalValue) > self.tolerance:
+                messages.append('Value at %s is %.6f, optimal is %.6f' % (state, value, optimalValue))
+            action = agent.getPolicy(state)
+            if action is not None:
+                qValue = optimal.computeQValueFromValues(state, action)
+                if qValue < optimalValue - self.tolerance:
+                    messages.append('Policy at %s is %s, worth %.6f against an optimal %.6f' %
+                                    (state, action, qValue, optimalValue))
+        if messages:
+            for message in messages[:10]:
+                self.addMessage(message)
+            if len(messages) > 10:
+                self.addMessage('... and %d more' % (len(messages) - 10))
+            return self.testFail(grades)
+        return self.testPass(grades)
+
+    def writeSolution(self, moduleDict, filePath):
+        with open(filePath, 'w') as handle:
+            handle.write('# This is the solution file for %s.\n' % self.path)
+            handle.write('# File intentionally blank.\n')
+        return True
+
+class EngineAgreementTest(testClasses.TestCase):
+    """
+    Checks that the ways of running value iteration that promise exactly
+    the same values do: each of the checks listed compares every state's
+    value, bit for bit, after valueIterations sweeps.
+        batched        engine 'batched' against engine 'loop'
+        parallel       engine 'parallel' (2 processes) against 'batched'
+        multidiscount  multiDiscountValueIteration over discounts against
+                       one 'batched' agent per discount
+        mdpfile        'batched' on an mdp saved and loaded with mdpFile
+                       against 'batched' on the mdp itself
+    """
+
+    def __init__(self, question, testDict):
+        super(EngineAgreementTest, self).__init__(question, testDict)
+        self.discount = float(testDict['discount'])
+        self.grid = getTestGrid(testDict)
+        self.iterations = int(testDict['valueIterations'])
+        self.checks = testDict['checks'].split()
+        self.discounts = [float(discount) for discount in testDict.get('discounts', '').split()]
+
+    def execute(self, grades, moduleDict, solutionDict):
+        module = moduleDict['valueIterationAgents']
+        states = self.grid.getStates()
+
+        def solve(grid, discount, engine, **args):
+            return module.ValueIterationAgent(grid, discount=discount, iterations=self.iterations,
+                                              engine=engine, **args)
+
+        def compare(name, agent, reference):
+            differing = [state for state in states if agent.getValue(state) != reference.getValue(state)]
+            if differing:
+                state = differing[0]
+                self.addMessage('%s: %d values differ, e.g. at %s %r instead of %r' %
+                                (name, len(differing), state, agent.getValue(state), reference.getValue(state)))
+            return not differing
+
+        batched = solve(self.grid, self.discount, 'batched')
+        passed = True
+        for check in self.checks:
+            if check == 'batched':
+                passed &= compare('batched engine', batched, solve(self.grid, self.discount, 'loop'))
+            elif check == 'parallel':
+                passed &= compare('parallel engine', solve(self.grid, self.discount, 'parallel', processes=2), batched)
+            elif check == 'multidiscount':
+                views = module.multiDiscountValueIteration(self.grid, self.discounts, self.iterations)
+                for discount, view in zip(self.discounts, views):
+                    passed &= compare('multi-discount at %s' % discount, view, solve(self.grid, discount, 'batched'))
+            elif check == 'mdpfile':
+                handle, fileName = tempfile.mkstemp(suffix='.mdp')
+                os.close(handle)
+                try:
+                    mdpFile.save(self.grid.compile(), fileName)
+                    passed &= compare('mdpFile round trip', solve(mdpFile.load(fileName), self.discount, 'batched'),
+                                      batched)
+                finally:
+                    os.remove(fileName)
+            else:
+                raise Exception('Unknown engine check: ' + check)
+        if not passed:
+            return self.testFail(grades)
+        return self.testPass(grades)
+
+    def writeSolution(self, moduleDict, filePath):
+        with open(filePath, 'w') as handle:
+            handle.write('# This is the solution file for %s.\n' % self.path)
+            handle.write('# File intentionally blank.\n')
+        return True
 
 class ApproximateQLearningTest(testClasses.TestCase):
 
@@ -345,15 +532,12 @@ class ApproximateQLearningTest(testClasses.TestCase):
         actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
         qValues = {}
         weights = agent.getWeights()
+        qTable = agent.getQTable(states, self.grid.getPossibleActions)
         for state in states:
-            possibleActions = self.grid.getPossibleActions(state)
             for action in actions:
                 if action not in qValues:
                     qValues[action] = {}
-                if action in possibleActions:
-                    qValues[action][state] = agent.getQValue(state, action)
-                else:
-                    qValues[action][state] = None
+                qValues[action][state] = qTable.get((state, action))
         qValuesPretty = {}
         for action in actions:
             qValuesPretty[action] = self.prettyValues(qValues[action])
@@ -521,20 +705,14 @@ class QLearningTest(testClasses.TestCase):
             lastExperience = self.experiences.get_experience()
             agent.update(*lastExperience)
         actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
-        values = {}
+        values, policy = agent.getValueTable(states)
         qValues = {}
-        policy = {}
+        qTable = agent.getQTable(states, self.grid.getPossibleActions)
         for state in states:
-            values[state] = agent.computeValueFromQValues(state)
-            policy[state] = agent.computeActionFromQValues(state)
-            possibleActions = self.grid.getPossibleActions(state)
             for action in actions:
                 if action not in qValues:
                     qValues[action] = {}
-                if action in possibleActions:
-                    qValues[action][state] = agent.getQValue(state, action)
-                else:
-                    qValues[action][state] = None
+                qValues[action][state] = qTable.get((state, action))
         valuesPretty = self.prettyValues(values)
         policyPretty = self.prettyPolicy(policy)
         qValuesPretty = {}
@@ -593,6 +771,81 @@ class QLearningTest(testClasses.TestCase):
         return values
 
 
+class DenseQLearningTest(QLearningTest):
+    """
+    QLearningTest with table='dense': on the same experiences the dense
+    table must learn exactly what the Counter table does, so these cases
+    share the names (which pick the experiences) and solutions of q6.
+    """
+    def __init__(self, question, testDict):
+        super(DenseQLearningTest, self).__init__(question, testDict)
+        self.opts['table'] = 'dense'
+
+
+class LearnedPolicyTest(testClasses.TestCase):
+    """
+    Trains a learning agent class from qlearningAgents, with the given
+    agentArgs, for the given number of episodes on a gridworld, with the
+    random module seeded.  Passes if the agent's greedy policy, evaluated
+    exactly on the mdp, is worth within tolerance of the optimal value at
+    the start state.
+    """
+
+    def __init__(self, question, testDict):
+        super(LearnedPolicyTest, self).__init__(question, testDict)
+        self.discount = float(testDict['discount'])
+        self.grid = getTestGrid(testDict)
+        self.agentName = testDict['agent']
+        self.agentArgs = parseTestArgs(testDict.get('agentArgs', ''))
+        self.episodes = int(testDict['episodes'])
+        self.seed = int(testDict['seed'])
+        self.tolerance = float(testDict['tolerance'])
+
+    def execute(self, grades, moduleDict, solutionDict):
+        env = gridworld.GridworldEnvironment(self.grid)
+        agent = getattr(moduleDict['qlearningAgents'], self.agentName)(actionFn=env.getPossibleActions,
+                                                                      gamma=self.discount, **self.agentArgs)
+        random.seed(self.seed)
+        ignore = lambda *args: None
+        for episode in range(self.episodes):
+            gridworld.runEpisode(agent, env, self.discount, agent.getAction, ignore, ignore, ignore, episode)
+
+        states = self.grid.getStates()
+        values, policy = agent.getValueTable(states)
+        worth = self.evaluatePolicy(policy)
+        optimal = moduleDict['valueIterationAgents'].ValueIterationAgent(self.grid, discount=self.discount,
+                                                                         iterations=100000, engine='batched',
+                                                                         tolerance=1e-8)
+        start = self.grid.getStartState()
+        if worth[start] < optimal.getValue(start) - self.tolerance:
+            self.addMessage('After %d episodes the greedy policy is worth %.4f from the start state; optimal is %.4f' %
+                            (self.episodes, worth[start], optimal.getValue(start)))
+            return self.testFail(grades)
+        return self.testPass(grades)
+
+    def evaluatePolicy(self, policy):
+        "The value of every state under policy, by sweeps to a 1e-10 change."
+        worth = Counter()
+        while True:
+            newWorth = Counter()
+            for state, action in policy.items():
+                if action is None:
+                    continue
+                for nextState, prob in self.grid.getTransitionStatesAndProbs(state, action):
+                    reward = self.grid.getReward(state, action, nextState)
+                    newWorth[state] += prob * (reward + self.discount * worth[nextState])
+            change = max([abs(newWorth[state] - worth[state]) for state in policy] or [0.0])
+            worth = newWorth
+            if change < 1e-10:
+                return worth
+
+    def writeSolution(self, moduleDict, filePath):
+        with open(filePath, 'w') as handle:
+            handle.write('# This is the solution file for %s.\n' % self.path)
+            handle.write('# File intentionally blank.\n')
+        return True
+
+
 class EpsilonGreedyTest(testClasses.TestCase):
 
     def __init__(self, question, testDict):
@@ -812,6 +1065,37 @@ def parseGrid(string):
             row[x] = col
     return gridworld.makeGrid(grid)
 
+def getTestGrid(testDict):
+    """
+    The Gridworld of a test: either a grid drawn as in parseGrid, or a
+    generator line "kind cells seed" for gridworldGenerator, with the
+    test's noise and livingReward applied.
+    """
+    if 'generator' in testDict:
+        kind, cells, seed = testDict['generator'].split()
+        grid = gridworldGenerator.generateGridworld(kind, int(cells), int(seed))
+    else:
+        grid = gridworld.Gridworld(parseGrid(testDict['grid']))
+    if 'noise' in testDict: grid.setNoise(float(testDict['noise']))
+    if 'livingReward' in testDict: grid.setLivingReward(float(testDict['livingReward']))
+    return grid
+
+def parseTestArgs(string):
+    """
+    Keyword arguments written as in pacman's -a option, key=value,...,
+    with each value read as a Python literal where it is one.
+    """
+    args = {}
+    for piece in string.split(','):
+        if '=' not in piece:
+            continue
+        key, value = [part.strip() for part in piece.split('=', 1)]
+        try:
+            args[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            args[key] = value
+    return args
+
 
 def computePolicy(moduleDict, grid, discount):
     valueIterator = moduleDict['valueIterationAgents'].ValueIterationAgent(grid, discount=discount)
@@ -32,9 +32,13 @@ class TextGridworldDisplay:
         values = util.Counter()
         policy = {}
         states = self.gridworld.getStates()
-        for state in states:
-            values[state] = agent.getValue(state)
-            policy[state] = agent.getPolicy(state)
+        if hasattr(agent, 'getValueTable'):
+            valueTable, policy = agent.getValueTable(states)
+            values.update(valueTable)
+        else:
+            for state in states:
+                values[state] = agent.getValue(state)
+                policy[state] = agent.getPolicy(state)
         prettyPrintValues(self.gridworld, values, policy, currentState)
 
     def displayNullValues(self, agent, currentState = None, message = None):
@@ -45,9 +49,12 @@ class TextGridworldDisplay:
         if message != None: print(message)
         qValues = util.Counter()
         states = self.gridworld.getStates()
-        for state in states:
-            for action in self.gridworld.getPossibleActions(state):
-                qValues[(state, action)] = agent.getQValue(state, action)
+        if hasattr(agent, 'getQTable'):
+            qValues.update(agent.getQTable(states, self.gridworld.getPossibleActions))
+        else:
+            for state in states:
+                for action in self.gridworld.getPossibleActions(state):
+                    qValues[(state, action)] = agent.getQValue(state, action)
         prettyPrintQValues(self.gridworld, qValues, currentState)
 
 
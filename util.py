@@ -27,6 +27,7 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import array
 import sys
 import inspect
 import heapq
@@ -242,6 +243,131 @@ class PriorityQueue:
             self.push(item, priority)
 
 
+class IndexedPriorityQueue:
+    """
+    A PriorityQueue that also keeps track of where each item sits in
+    the heap, so that changing the priority of a queued item costs
+    O(log n) instead of a linear scan and a re-heapify.
+
+    Items must be hashable and are unique in the queue.  Ties are broken
+    in insertion order, and update keeps an item's original insertion
+    slot, so items come out in the same order as from PriorityQueue.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.position = {}
+        self.count = 0
+
+    def push(self, item, priority):
+        "Adds item, or changes its priority if it is already queued"
+        if item in self.position:
+            self.changePriority(item, priority)
+            return
+        self.heap.append([priority, self.count, item])
+        self.position[item] = len(self.heap) - 1
+        self.count += 1
+        self._siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        heap = self.heap
+        entry = heap[0]
+        last = heap.pop()
+        del self.position[entry[2]]
+        if heap:
+            heap[0] = last
+            self.position[last[2]] = 0
+            self._siftDown(0)
+        return entry[2]
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def getPriority(self, item):
+        return self.heap[self.position[item]][0]
+
+    def peekPriority(self):
+        "Returns the lowest priority in the queue without removing it"
+        return self.heap[0][0]
+
+    def update(self, item, priority):
+        # Same contract as PriorityQueue.update: lower the priority of a
+        # queued item, leave it alone if it is already lower or equal, and
+        # push the item if it is not queued.
+        index = self.position.get(item)
+        if index is None:
+            self.push(item, priority)
+        elif priority < self.heap[index][0]:
+            self.heap[index][0] = priority
+            self._siftUp(index)
+
+    def changePriority(self, item, priority):
+        "Sets the priority of a queued item, whether it goes up or down"
+        index = self.position[item]
+        old = self.heap[index][0]
+        self.heap[index][0] = priority
+        if priority < old:
+            self._siftUp(index)
+        elif priority > old:
+            self._siftDown(index)
+
+    def remove(self, item):
+        "Removes a queued item"
+        index = self.position.pop(item)
+        last = self.heap.pop()
+        if index < len(self.heap):
+            self.heap[index] = last
+            self.position[last[2]] = index
+            self._siftUp(index)
+            self._siftDown(self.position[last[2]])
+
+    def _siftUp(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        key = (entry[0], entry[1])
+        while index > 0:
+            parentIndex = (index - 1) >> 1
+            parent = heap[parentIndex]
+            if key < (parent[0], parent[1]):
+                heap[index] = parent
+                position[parent[2]] = index
+                index = parentIndex
+            else:
+                break
+        heap[index] = entry
+        position[entry[2]] = index
+
+    def _siftDown(self, index):
+        heap, position = self.heap, self.position
+        size = len(heap)
+        entry = heap[index]
+        key = (entry[0], entry[1])
+        while True:
+            childIndex = 2 * index + 1
+            if childIndex >= size:
+                break
+            child = heap[childIndex]
+            rightIndex = childIndex + 1
+            if rightIndex < size:
+                right = heap[rightIndex]
+                if (right[0], right[1]) < (child[0], child[1]):
+                    childIndex, child = rightIndex, right
+            if (child[0], child[1]) < key:
+                heap[index] = child
+                position[child[2]] = index
+                index = childIndex
+            else:
+                break
+        heap[index] = entry
+        position[entry[2]] = index
+
+
 class PriorityQueueWithFunction(PriorityQueue):
     """
     Implements a priority queue with the same push/pop signature of the
@@ -490,6 +616,314 @@ class Counter(dict):
         return addend
 
 
+class DenseQTable:
+    """
+    A table of values keyed by (state, action), for QLearningAgent to use
+    in place of a Counter.  States and actions are interned to integer
+    ids the first time a value is stored for them, and the values live
+    in one flat array of doubles with a row of slots per state, so the
+    table grows by one row per new state instead of one dict entry per
+    pair.
+
+    Indexing works as for a Counter, except that reading a pair that was
+    never stored gives 0.0 and adds nothing to the table.  getRow reads
+    several actions of one state at once.
+    """
+
+    def __init__(self):
+        self.stateIds = {}
+        self.actionIds = {}
+        self.width = 0
+        self.values = array.array('d')
+
+    def __len__(self):
+        "The number of states in the table"
+        return len(self.stateIds)
+
+    def __getitem__(self, key):
+        state, action = key
+        stateId = self.stateIds.get(state)
+        actionId = self.actionIds.get(action)
+        if stateId is None or actionId is None:
+            return 0.0
+        return self.values[stateId * self.width + actionId]
+
+    def __setitem__(self, key, value):
+        state, action = key
+        actionId = self.internAction(action)
+        stateId = self.internState(state)
+        self.values[stateId * self.width + actionId] = value
+
+    def get(self, key, default=0.0):
+        "Like dict.get: default unless both the state and the action are known"
+        state, action = key
+        if state not in self.stateIds or action not in self.actionIds:
+            return default
+        return self[key]
+
+    def getRow(self, state, actions):
+        "[self[(state, action)] for action in actions], with one state lookup"
+        stateId = self.stateIds.get(state)
+        if stateId is None:
+            return [0.0] * len(actions)
+        values, actionIds = self.values, self.actionIds
+        base = stateId * self.width
+        return [values[base + actionIds[action]] if action in actionIds else 0.0
+                for action in actions]
+
+    def internState(self, state):
+        stateId = self.stateIds.get(state)
+        if stateId is None:
+            stateId = self.stateIds[state] = len(self.stateIds)
+            self.values.extend(array.array('d', [0.0]) * self.width)
+        return stateId
+
+    def internAction(self, action):
+        actionId = self.actionIds.get(action)
+        if actionId is None:
+            actionId = self.actionIds[action] = len(self.actionIds)
+            if actionId >= self.width:
+                self.widen(max(4, 2 * self.width))
+        return actionId
+
+    def widen(self, width):
+        "Re-lays out the rows with width slots each"
+        old, oldWidth = self.values, self.width
+        padding = array.array('d', [0.0]) * (width - oldWidth)
+        self.values = array.array('d')
+        for stateId in range(len(self.stateIds)):
+            self.values.extend(old[stateId * oldWidth:(stateId + 1) * oldWidth])
+            self.values.extend(padding)
+        self.width = width
+
+
+class ReplayBuffer:
+    """
+    A fixed-capacity ring buffer of transitions for experience replay;
+    once it is full, each new transition overwrites the oldest.
+
+    The transitions are kept in parallel arrays of state ids, action ids,
+    rewards and next-state ids.  Each state id counts the slots that use
+    it and is released, together with its state, when the last of them
+    is overwritten, so the buffer never holds more than 2 * capacity
+    states however long it runs.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.stateIds = array.array('i', [0]) * self.capacity
+        self.actionIds = array.array('i', [0]) * self.capacity
+        self.rewards = array.array('d', [0.0]) * self.capacity
+        self.nextStateIds = array.array('i', [0]) * self.capacity
+        self.size = 0
+        self.nextSlot = 0
+        self.stateIndex = {}
+        self.states = []
+        self.references = []
+        self.freeIds = []
+        self.actionIndex = {}
+        self.actions = []
+
+    def __len__(self):
+        return self.size
+
+    def push(self, state, action, nextState, reward):
+        "Adds a transition, in the argument order of ReinforcementAgent.update"
+        slot = self.nextSlot
+        if self.size == self.capacity:
+            self.release(self.stateIds[slot])
+            self.release(self.nextStateIds[slot])
+        else:
+            self.size += 1
+        actionId = self.actionIndex.get(action)
+        if actionId is None:
+            actionId = self.actionIndex[action] = len(self.actions)
+            self.actions.append(action)
+        self.stateIds[slot] = self.intern(state)
+        self.actionIds[slot] = actionId
+        self.rewards[slot] = reward
+        self.nextStateIds[slot] = self.intern(nextState)
+        self.nextSlot = (slot + 1) % self.capacity
+
+    def getTransition(self, slot):
+        "The (state, action, nextState, reward) stored in slot"
+        return (self.states[self.stateIds[slot]], self.actions[self.actionIds[slot]],
+                self.states[self.nextStateIds[slot]], self.rewards[slot])
+
+    def sample(self, batchSize):
+        "batchSize transitions drawn uniformly, with replacement"
+        return [self.getTransition(random.randrange(self.size)) for i in range(batchSize)]
+
+    def intern(self, state):
+        stateId = self.stateIndex.get(state)
+        if stateId is None:
+            if self.freeIds:
+                stateId = self.freeIds.pop()
+                self.states[stateId] = state
+            else:
+                stateId = len(self.states)
+                self.states.append(state)
+                self.references.append(0)
+            self.stateIndex[state] = stateId
+        self.references[stateId] += 1
+        return stateId
+
+    def release(self, stateId):
+        self.references[stateId] -= 1
+        if self.references[stateId] == 0:
+            del self.stateIndex[self.states[stateId]]
+            self.states[stateId] = None
+            self.freeIds.append(stateId)
+
+
+class SumTree:
+    """
+    A fixed number of non-negative values (all 0.0 to begin with) in
+    the leaves of a binary tree whose inner nodes hold the sum of their
+    children.  Changing a value and finding the index at which the
+    running total passes a given amount both take O(log n), so sampling
+    an index in proportion to its value never needs to normalize.
+
+    The tree is one array of doubles: node 1 is the root, node i has
+    children 2i and 2i+1, and value index i is node capacity + i.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.nodes = array.array('d', [0.0]) * (2 * self.capacity)
+
+    def __len__(self):
+        return self.capacity
+
+    def __getitem__(self, index):
+        return self.nodes[self.capacity + index]
+
+    def __setitem__(self, index, value):
+        nodes = self.nodes
+        node = self.capacity + index
+        nodes[node] = value
+        node >>= 1
+        while node >= 1:
+            nodes[node] = nodes[2 * node] + nodes[2 * node + 1]
+            node >>= 1
+
+    def total(self):
+        return self.nodes[1]
+
+    def find(self, amount):
+        """
+        The index whose value contains the point amount of the running
+        total, for 0 <= amount < total().  Never returns an index whose
+        value is 0.0 while the total is positive.
+        """
+        nodes, capacity = self.nodes, self.capacity
+        node = 1
+        while node < capacity:
+            left = 2 * node
+            if amount < nodes[left] or nodes[left + 1] == 0.0:
+                node = left
+            else:
+                amount -= nodes[left]
+                node = left + 1
+        return node - capacity
+
+    def sample(self):
+        "An index drawn with probability proportional to its value"
+        return self.find(random.random() * self.total())
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    A ReplayBuffer that samples transitions in proportion to a priority,
+    (|TD error| + minError) ** priorityExponent, kept in a SumTree.  New
+    transitions get the highest priority seen so far, so each is
+    replayed at least once.  sample also returns importance-sampling
+    weights, (size * P(i)) ** -importanceExponent scaled so the largest
+    in the batch is 1, which undo the bias of the skewed sampling.
+    """
+
+    def __init__(self, capacity, priorityExponent=0.6, importanceExponent=0.4, minError=1e-3):
+        ReplayBuffer.__init__(self, capacity)
+        self.priorityExponent = float(priorityExponent)
+        self.importanceExponent = float(importanceExponent)
+        self.minError = float(minError)
+        self.priorities = SumTree(self.capacity)
+        self.maxPriority = 1.0
+
+    def push(self, state, action, nextState, reward):
+        slot = self.nextSlot
+        ReplayBuffer.push(self, state, action, nextState, reward)
+        self.priorities[slot] = self.maxPriority
+
+    def sample(self, batchSize):
+        """
+        Returns (slots, transitions, weights) for batchSize transitions
+        drawn with replacement, one from each of batchSize equal slices
+        of the total priority.
+        """
+        priorities = self.priorities
+        total = priorities.total()
+        slots = [priorities.find((i + random.random()) * total / batchSize) for i in range(batchSize)]
+        weights = [(self.size * priorities[slot] / total) ** -self.importanceExponent for slot in slots]
+        largest = max(weights)
+        return (slots, [self.getTransition(slot) for slot in slots],
+                [weight / largest for weight in weights])
+
+    def updatePriority(self, slot, error):
+        "Sets the priority of slot from the TD error of its last replay"
+        priority = (abs(error) + self.minError) ** self.priorityExponent
+        self.priorities[slot] = priority
+        if priority > self.maxPriority:
+            self.maxPriority = priority
+
+
+class EligibilityTraces:
+    """
+    Sparse eligibility traces: a dict from key to trace that only holds
+    the keys whose trace is at least cutoff in size.  Each decay drops
+    the traces that fall below it, so a pass over the traces costs the
+    number of recently visited keys, not the size of the table or
+    feature space behind them.  If more than capacity traces survive
+    anyway (a decay factor at or near 1), only the capacity // 2
+    largest are kept.
+    """
+
+    def __init__(self, cutoff=0.01, capacity=1000):
+        self.cutoff = float(cutoff)
+        self.capacity = int(capacity)
+        self.traces = {}
+
+    def __len__(self):
+        return len(self.traces)
+
+    def clear(self):
+        self.traces.clear()
+
+    def items(self):
+        return self.traces.items()
+
+    def add(self, key, amount=1.0):
+        "Accumulating trace: adds amount to the trace of key"
+        self.traces[key] = self.traces.get(key, 0.0) + amount
+
+    def replace(self, key, amount=1.0):
+        "Replacing trace: sets the trace of key to amount"
+        self.traces[key] = amount
+
+    def decay(self, factor):
+        "Multiplies every trace by factor and prunes the small ones"
+        traces, cutoff = self.traces, self.cutoff
+        for key, value in list(traces.items()):
+            value *= factor
+            if -cutoff < value < cutoff:
+                del traces[key]
+            else:
+                traces[key] = value
+        if len(traces) > self.capacity:
+            largest = heapq.nlargest(self.capacity // 2, traces.items(), key=lambda item: abs(item[1]))
+            self.traces = dict(largest)
+
+
 def raiseNotDefined():
     fileName = inspect.stack()[1][1]
     line = inspect.stack()[1][2]
@@ -29,7 +29,267 @@
 import mdp, util
 
 from learningAgents import ValueEstimationAgent
+import array
 import collections
+import copy
+import math
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
+
+import mdpFile
+
+class ValueIterationStats:
+    """
+      Telemetry recorded by the value iteration agents while they run.
+
+        residuals  the largest change of any state value in each sweep
+        backups    the number of single-state Bellman backups performed
+        wallTime   seconds spent running value iteration
+        converged  whether the tolerance was met before the iteration cap
+        timedOut   whether the last solve stopped on its time budget
+
+      For the asynchronous agents a "sweep" is a block of as many backups
+      as there are states, and its residual is only recorded once the
+      block is complete; partialSweep is True while one is under way.
+      The prioritized and topological agents back up states unevenly, so
+      their blocks only bound the error at convergence, and partialSweep
+      is set whenever they stop short of it (out of time or iterations).
+      After a warm-started re-solve (see
+      ValueIterationAgent.resolve), warmStart is True and, if a cold solve
+      was run for comparison, coldBackups and savedBackups are set.
+    """
+    def __init__(self):
+        self.residuals = []
+        self.backups = 0
+        self.wallTime = 0.0
+        self.converged = False
+        self.timedOut = False
+        self.partialSweep = False
+        self.warmStart = False
+        self.coldBackups = None
+        self.savedBackups = None
+
+    def getSweeps(self):
+        return len(self.residuals)
+
+    def getResidual(self):
+        "The residual of the last sweep (None before the first sweep)."
+        if len(self.residuals) == 0:
+            return None
+        return self.residuals[-1]
+
+    def getErrorBound(self, discount):
+        """
+          Bound on max_s |V(s) - V*(s)| implied by the last residual:
+          gamma * residual / (1 - gamma).  Infinite when gamma >= 1 or
+          while a sweep is incomplete, as the values have moved since.
+        """
+        residual = self.getResidual()
+        if residual is None or discount >= 1 or self.partialSweep:
+            return float('inf')
+        return discount * residual / (1 - discount)
+
+    def __str__(self):
+        summary = '%d sweeps, %d backups, residual %s, %.3fs%s' % (
+            self.getSweeps(), self.backups, self.getResidual(), self.wallTime,
+            self.converged and ' (converged)' or self.timedOut and ' (out of time)' or '')
+        if self.savedBackups is not None:
+            summary += ', saved %d of %d backups' % (self.savedBackups, self.coldBackups)
+        return summary
+
+def withinTolerance(residual, discount, tolerance):
+    """
+      See ValueIterationAgent.hasConverged.  A tolerance of None never
+      converges.
+    """
+    if tolerance is None:
+        return False
+    if discount >= 1:
+        return residual <= tolerance
+    return discount * residual <= tolerance * (1 - discount)
+
+def batchedSweep(compiled, values, discount):
+    """
+      One synchronous Bellman sweep over a CompiledMDP (see mdp.py).
+
+      values is a vector indexed by state id (see CompiledMDP.newVector);
+      a new one is returned.  The arithmetic is the same as
+      ValueIterationAgent.computeQValueFromValues term for term, so the
+      result matches the 'loop' engine exactly unless the mdp was
+      compiled in single precision.
+    """
+    newValues = compiled.newVector()
+    sweepStates(compiled, values, discount, newValues, 0, compiled.numStates)
+    return newValues
+
+def sweepStates(compiled, values, discount, newValues, first, last):
+    """
+      The part of batchedSweep for state ids first..last-1: writes their
+      backed-up values into newValues, and 0 for states that are terminal
+      or have no actions.
+    """
+    terminal, actionStart, rowStart = compiled.terminal, compiled.actionStart, compiled.rowStart
+    nextState, prob, reward = compiled.nextState, compiled.prob, compiled.reward
+    for i in range(first, last):
+        if terminal[i]:
+            newValues[i] = 0.0
+            continue
+        best = None
+        for r in range(actionStart[i], actionStart[i+1]):
+            qValue = 0
+            for k in range(rowStart[r], rowStart[r+1]):
+                qValue += prob[k] * (reward[k] + discount * values[nextState[k]])
+            if best is None or qValue > best:
+                best = qValue
+        if best is None:
+            newValues[i] = 0.0
+        else:
+            newValues[i] = best
+
+def countBackups(compiled):
+    "The number of states a sweep backs up: those not terminal and with actions."
+    terminal, actionStart = compiled.terminal, compiled.actionStart
+    return sum(1 for i in range(compiled.numStates)
+               if not terminal[i] and actionStart[i] < actionStart[i+1])
+
+def partitionStates(compiled, parts):
+    """
+      Splits the state ids into parts contiguous ranges with about the
+      same number of transition entries each.  Returns the parts + 1
+      boundaries.
+    """
+    actionStart, rowStart = compiled.actionStart, compiled.rowStart
+    numStates = compiled.numStates
+    total = len(compiled.nextState)
+    bounds = [0]
+    i = 0
+    for part in range(1, parts):
+        target = total * part // parts
+        while i < numStates and rowStart[actionStart[i]] < target:
+            i += 1
+        bounds.append(i)
+    bounds.append(numStates)
+    return bounds
+
+def parallelSweepWorker(source, worker, bounds, buffers, residuals, history, outcome, barrier,
+                        discount, iterations, tolerance):
+    """
+      Body of one parallelValueIteration process.  Each sweep reads the
+      previous values from one shared buffer and writes this worker's
+      slice of the new values into the other.  Then it posts its largest
+      change and waits at the barrier.  Every worker then sees the same
+      residuals and so makes the same decision to stop.  The residual
+      slots alternate between two halves so a worker that runs ahead
+      cannot overwrite ones still being read.
+    """
+    if isinstance(source, str):
+        source = mdpFile.load(source)
+    compiled = source
+    floatCode = mdp.PRECISIONS.get(compiled.precision, 'd')
+    views = [memoryview(buffer).cast('B').cast(floatCode) for buffer in buffers]
+    parts = len(bounds) - 1
+    first, last = bounds[worker], bounds[worker+1]
+    for sweep in range(iterations):
+        values, newValues = views[sweep % 2], views[1 - sweep % 2]
+        sweepStates(compiled, values, discount, newValues, first, last)
+        half = (sweep % 2) * parts
+        residuals[half + worker] = max([abs(new - old) for new, old in
+                                        zip(newValues[first:last], values[first:last])] or [0.0])
+        barrier.wait()
+        residual = max(residuals[half:half + parts])
+        if worker == 0:
+            history[sweep] = residual
+            outcome[0] = sweep + 1
+        if withinTolerance(residual, discount, tolerance):
+            if worker == 0:
+                outcome[1] = 1
+            return
+
+def parallelValueIteration(compiled, values, discount, iterations, tolerance=None, processes=None):
+    """
+      Runs the synchronous sweeps of the 'batched' engine with the states
+      split across processes (see partitionStates and parallelSweepWorker).
+      Every state is backed up with the same arithmetic from the same
+      previous values, so the results are bit-for-bit those of the
+      single-process engine.
+
+      The workers share the value vectors through multiprocessing shared
+      memory and the mdp through an mdpFile mapping.  An mdp that was
+      loaded with mdpFile.load is mapped from its own file; any other is
+      saved to a temporary file first.  processes defaults to one per CPU.
+
+      Returns (values, residuals, converged).
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, compiled.numStates))
+    floatCode = mdp.PRECISIONS.get(compiled.precision, 'd')
+    buffers = [multiprocessing.RawArray(floatCode, compiled.numStates) for i in range(2)]
+    memoryview(buffers[0]).cast('B').cast(floatCode)[:] = array.array(floatCode, values)
+    residuals = multiprocessing.RawArray('d', 2 * processes)
+    history = multiprocessing.RawArray('d', max(iterations, 1))
+    outcome = multiprocessing.RawArray('i', 2)
+    barrier = multiprocessing.Barrier(processes)
+    bounds = partitionStates(compiled, processes)
+    arguments = (bounds, buffers, residuals, history, outcome, barrier, discount, iterations, tolerance)
+
+    if processes == 1:
+        parallelSweepWorker(compiled, 0, *arguments)
+    else:
+        fileName = getattr(compiled, 'fileName', None)
+        temporary = None
+        if fileName is None:
+            handle, temporary = tempfile.mkstemp(suffix='.mdp')
+            os.close(handle)
+            mdpFile.save(compiled, temporary)
+            fileName = temporary
+        workers = [multiprocessing.Process(target=parallelSweepWorker, args=(fileName, worker) + arguments)
+                   for worker in range(processes)]
+        try:
+            for process in workers:
+                process.start()
+            running = list(workers)
+            while running:
+                for process in running:
+                    process.join(0.05)
+                    if process.exitcode is not None and process.exitcode != 0:
+                        barrier.abort()
+                        raise Exception('Value iteration worker failed with exit code %d' % process.exitcode)
+                running = [process for process in running if process.exitcode is None]
+        finally:
+            for process in workers:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            if temporary is not None:
+                os.remove(temporary)
+
+    sweeps = outcome[0]
+    finalValues = memoryview(buffers[sweeps % 2]).cast('B').cast(floatCode)
+    return compiled.newVector(finalValues), list(history[:sweeps]), bool(outcome[1])
+
+def greedyPolicy(compiled, values, discount):
+    """
+      Returns, for every state id, the first action with the highest
+      Q-value under values (None where there are no actions).
+    """
+    actionStart, rowStart, rowAction = compiled.actionStart, compiled.rowStart, compiled.rowAction
+    nextState, prob, reward = compiled.nextState, compiled.prob, compiled.reward
+    policy = [None] * compiled.numStates
+    for i in range(compiled.numStates):
+        best = None
+        for r in range(actionStart[i], actionStart[i+1]):
+            qValue = 0
+            for k in range(rowStart[r], rowStart[r+1]):
+                qValue += prob[k] * (reward[k] + discount * values[nextState[k]])
+            if best is None or qValue > best:
+                best = qValue
+                policy[i] = rowAction[r]
+    return policy
 
 class ValueIterationAgent(ValueEstimationAgent):
     """
@@ -40,7 +300,8 @@ class ValueIterationAgent(ValueEstimationAgent):
         for a given number of iterations using the supplied
         discount factor.
     """
-    def __init__(self, mdp, discount = 0.9, iterations = 100):
+    def __init__(self, mdp, discount = 0.9, iterations = 100, engine = 'loop', tolerance = None,
+                 processes = None, snapshots = None, timeBudget = None, checkpoint = None):
         """
           Your value iteration agent should take an mdp on
           construction, run the indicated number of iterations
@@ -52,16 +313,346 @@ class ValueIterationAgent(ValueEstimationAgent):
               mdp.getTransitionStatesAndProbs(state, action)
               mdp.getReward(state, action, nextState)
               mdp.isTerminal(state)
+
+          engine selects how the sweeps are run:
+              'loop'     goes through the mdp methods above
+              'batched'  compiles the mdp once (see mdp.compile) and runs
+                         every sweep over the flat transition arrays
+              'parallel' runs the 'batched' sweeps split across processes
+                         worker processes (default one per CPU)
+          All engines compute exactly the same values.
+
+          If tolerance is given, iterations is only an upper bound: the
+          agent stops as soon as the Bellman residual guarantees that every
+          value is within tolerance of optimal (see hasConverged).  Either
+          way, per-sweep residuals, backups and wall time are recorded in
+          self.stats.
+
+          snapshots is a collection of iteration counts k at which to keep
+          a copy of the values (0 is the starting values); getSnapshot(k)
+          then gives the agent that ValueIterationAgent(mdp, discount, k)
+          would have been, without solving again.  The 'parallel' engine
+          does not take snapshots.
+
+          With a timeBudget (in seconds) the agent stops after the first
+          sweep that ends past the budget, so it can overrun by a sweep and
+          the policy extraction.  It keeps the greedy policy of the values
+          so far; self.stats.timedOut is set, and self.stats.getErrorBound
+          gives how far from optimal they can be.  resume() carries on
+          where it stopped.  saveCheckpoint writes the values and
+          iteration count to a file, and passing that file as checkpoint
+          starts a new agent from it instead of from zero.
         """
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
+        self.engine = engine
+        self.tolerance = tolerance
+        self.processes = processes
+        self.snapshotIterations = set(snapshots or ())
+        self.timeBudget = timeBudget
+        self.completedIterations = 0
+        self.cycleResidual = 0.0
         self.values = util.Counter() # A Counter is a dict with default 0
-        self.runValueIteration()
+        self.policy = None
+        self.stats = ValueIterationStats()
+        self.snapshots = {}
+        self.snapshotStates = None
+        if checkpoint is not None:
+            self.loadCheckpoint(checkpoint)
+            self.resume()
+        else:
+            self.solve()
+
+    def solve(self):
+        """
+          Runs value iteration with the selected engine, starting from the
+          current self.values and self.completedIterations, and times it
+          into self.stats.
+        """
+        startTime = time.time()
+        self.deadline = None
+        if self.timeBudget is not None:
+            self.deadline = startTime + self.timeBudget
+        self.stats.timedOut = False
+        if self.completedIterations == 0:
+            self.snapshots = {}
+            self.snapshotStates = None
+        if self.engine == 'parallel' and (self.snapshotIterations or self.timeBudget is not None):
+            raise Exception('The parallel engine takes neither snapshots nor a time budget')
+        if self.engine == 'batched':
+            self.runBatchedValueIteration()
+        elif self.engine == 'parallel':
+            self.runParallelValueIteration()
+        elif self.engine == 'loop':
+            self.runValueIteration()
+        else:
+            raise Exception('Unknown value iteration engine: ' + str(self.engine))
+        self.stats.wallTime += time.time() - startTime
+
+    def outOfTime(self):
+        """
+          True once the running solve has used up self.timeBudget (and
+          then also marks self.stats as timed out).  The agents check it
+          after every sweep or comparable unit of work.
+        """
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stats.timedOut = True
+            return True
+        return False
+
+    def resume(self, timeBudget = None):
+        """
+          Continues a solve that ran out of time, or that was loaded with
+          loadCheckpoint, from where it stopped; a new timeBudget replaces
+          the old one.  Does nothing if the solve has already converged.
+          Returns self.stats.
+
+          For the synchronous engines and the cyclic agent the result
+          (values, iteration count, backups and residuals) is exactly that
+          of an uninterrupted solve.  The prioritized, topological, RTDP
+          and policy iteration agents start their procedure again from the
+          current values; bounded value iteration starts again from its
+          initial bounds, so resuming it only gives it more time.
+        """
+        if timeBudget is not None:
+            self.timeBudget = timeBudget
+        if not self.stats.converged:
+            self.solve()
+        return self.stats
+
+    def saveCheckpoint(self, fileName):
+        """
+          Writes the values (in getStates() order), the number of
+          iterations completed, the residual of an incomplete cyclic sweep
+          and the stats so far to fileName.  States without a value in
+          self.values are written as NaN and left without one on load, so
+          agents that value such states specially (RTDP) restore exactly.
+        """
+        states = self.mdp.getStates()
+        checkpoint = {'numStates': len(states),
+                      'discount': self.discount,
+                      'values': array.array('d', [float(self.values.get(state, float('nan'))) for state in states]),
+                      'completedIterations': self.completedIterations,
+                      'cycleResidual': self.cycleResidual,
+                      'residuals': list(self.stats.residuals),
+                      'backups': self.stats.backups,
+                      'converged': self.stats.converged,
+                      'partialSweep': self.stats.partialSweep}
+        with open(fileName, 'wb') as handle:
+            pickle.dump(checkpoint, handle, pickle.HIGHEST_PROTOCOL)
+
+    def loadCheckpoint(self, fileName):
+        """
+          Restores the values, iteration count and stats written by
+          saveCheckpoint for the same mdp; call resume() to carry on.
+        """
+        with open(fileName, 'rb') as handle:
+            checkpoint = pickle.load(handle)
+        states = self.mdp.getStates()
+        if checkpoint['numStates'] != len(states):
+            raise Exception('Checkpoint %s is for an mdp with %d states, not %d' %
+                            (fileName, checkpoint['numStates'], len(states)))
+        self.values = util.Counter()
+        for state, value in zip(states, checkpoint['values']):
+            if not math.isnan(value):
+                self.values[state] = value
+        self.policy = None
+        self.completedIterations = checkpoint['completedIterations']
+        self.cycleResidual = checkpoint['cycleResidual']
+        self.stats = ValueIterationStats()
+        self.stats.residuals = checkpoint['residuals']
+        self.stats.backups = checkpoint['backups']
+        self.stats.converged = checkpoint['converged']
+        self.stats.partialSweep = checkpoint['partialSweep']
+
+    def resolve(self, discount = None, noise = None, livingReward = None, tolerance = None,
+                compareCold = False):
+        """
+          Re-solves after a change of parameters, starting from the values
+          (and, for policy iteration, the policy) of the previous solve
+          instead of from zero.  noise and livingReward are set on the mdp
+          through setNoise and setLivingReward, so they also apply to any
+          other agent sharing the mdp.
+
+          A warm start only pays off if the agent stops at convergence, so
+          a tolerance is required (given here or on construction); the
+          iteration count remains the cap.  With compareCold, a copy of the
+          agent is also solved from zero so that self.stats reports how
+          many backups the warm start saved.
+
+          Returns the new self.stats.
+        """
+        if discount is not None:
+            self.discount = discount
+        if noise is not None:
+            self.mdp.setNoise(noise)
+        if livingReward is not None:
+            self.mdp.setLivingReward(livingReward)
+        if tolerance is not None:
+            self.tolerance = tolerance
+        if self.tolerance is None:
+            raise Exception('resolve needs a tolerance to know when it has converged')
+
+        if compareCold:
+            cold = copy.copy(self)
+            cold.values = util.Counter()
+            cold.policy = None
+            cold.completedIterations = 0
+            cold.cycleResidual = 0.0
+            cold.stats = ValueIterationStats()
+            cold.solve()
+
+        self.policy = self.getWarmPolicy()
+        self.completedIterations = 0
+        self.cycleResidual = 0.0
+        self.stats = ValueIterationStats()
+        self.stats.warmStart = True
+        self.solve()
+        if compareCold:
+            self.stats.coldBackups = cold.stats.backups
+            self.stats.savedBackups = cold.stats.backups - self.stats.backups
+        return self.stats
+
+    def getWarmPolicy(self):
+        """
+          The policy table a warm-started solve should begin from.  Only
+          policy iteration uses one; value iteration starts from values.
+        """
+        return None
+
+    def hasConverged(self, residual):
+        """
+          True if a sweep whose largest value change was residual is close
+          enough to the fixed point.  With discount gamma < 1, a residual r
+          bounds the distance to the optimal values by gamma * r / (1 - gamma),
+          so we stop once that bound is within self.tolerance.
+        """
+        return withinTolerance(residual, self.discount, self.tolerance)
+
+    def takeSnapshot(self, sweeps, states, values):
+        """
+          Keeps values (in the order of states) as the snapshot after the
+          given number of sweeps, if that is one of the requested ones.
+        """
+        if sweeps in self.snapshotIterations:
+            self.snapshotStates = states
+            self.snapshots[sweeps] = array.array('d', values)
+
+    def getSnapshot(self, iterations):
+        """
+          A read-only ValueIterationView of the values after the given
+          number of iterations of the last solve, which must have been
+          requested with snapshots and reached before the solve stopped.
+        """
+        if iterations not in self.snapshots:
+            raise Exception('No snapshot was taken after %d iterations' % iterations)
+        values = util.Counter()
+        for state, value in zip(self.snapshotStates, self.snapshots[iterations]):
+            values[state] = value
+        return ValueIterationView(self.mdp, self.discount, values, iterations)
+
+    def computeBestQValue(self, state):
+        """
+          max_a Q(state, a) under the current values, or None if the state
+          is terminal or has no legal actions.
+        """
+        if self.mdp.isTerminal(state):
+            return None
+        actions = self.mdp.getPossibleActions(state)
+        if len(actions) == 0:
+            return None
+        return max([self.computeQValueFromValues(state, action) for action in actions])
 
     def runValueIteration(self):
         # Write value iteration code here
-        "*** YOUR CODE HERE ***"
+        states = self.mdp.getStates()
+        if self.snapshotIterations:
+            self.takeSnapshot(self.completedIterations, states, [self.values.get(state, 0) for state in states])
+        for i in range(self.completedIterations, self.iterations):
+            newValues = util.Counter()
+            residual = 0.0
+            for state in states:
+                value = self.computeBestQValue(state)
+                if value is None:
+                    continue
+                newValues[state] = value
+                residual = max(residual, abs(value - self.values[state]))
+                self.stats.backups += 1
+            self.values = newValues
+            self.completedIterations = i + 1
+            self.stats.residuals.append(residual)
+            if self.snapshotIterations:
+                self.takeSnapshot(i + 1, states, [newValues.get(state, 0) for state in states])
+            if self.hasConverged(residual):
+                self.stats.converged = True
+                break
+            if self.outOfTime():
+                break
+
+    def runBatchedValueIteration(self):
+        """
+          Runs the same synchronous sweeps as runValueIteration over the
+          arrays of the compiled mdp, then fills self.values and a policy
+          table so that getPolicy is a lookup (see storeSolution).
+        """
+        compiled = self.mdp.compile()
+        values = self.getStartVector(compiled)
+        backupsPerSweep = countBackups(compiled)
+        self.takeSnapshot(self.completedIterations, compiled.states, values)
+        for i in range(self.completedIterations, self.iterations):
+            newValues = batchedSweep(compiled, values, self.discount)
+            residual = max(abs(new - old) for new, old in zip(newValues, values))
+            values = newValues
+            self.completedIterations = i + 1
+            self.stats.backups += backupsPerSweep
+            self.stats.residuals.append(residual)
+            self.takeSnapshot(i + 1, compiled.states, values)
+            if self.hasConverged(residual):
+                self.stats.converged = True
+                break
+            if self.outOfTime():
+                break
+        self.storeSolution(compiled, values)
+
+    def runParallelValueIteration(self):
+        """
+          The 'batched' engine with every sweep split across
+          self.processes worker processes (see parallelValueIteration);
+          the values, policy and stats come out exactly the same.
+        """
+        compiled = self.mdp.compile()
+        values, residuals, converged = parallelValueIteration(
+            compiled, self.getStartVector(compiled), self.discount,
+            self.iterations - self.completedIterations, self.tolerance, self.processes)
+        self.completedIterations += len(residuals)
+        self.stats.backups += countBackups(compiled) * len(residuals)
+        self.stats.residuals.extend(residuals)
+        self.stats.converged = converged
+        self.storeSolution(compiled, values)
+
+    def getStartVector(self, compiled):
+        "The current self.values as a vector by state id of compiled."
+        return compiled.newVector(float(self.values.get(state, 0)) for state in compiled.states)
+
+    def storeSolution(self, compiled, values):
+        """
+          Sets self.values and self.policy from a value vector of compiled.
+          For an array-backed CompiledMDP (compiled with a precision, see
+          mdp.py) they stay vectors by state id behind mdp.StateVector
+          mappings instead of being copied into dictionaries.
+        """
+        policy = greedyPolicy(compiled, values, self.discount)
+        if compiled.precision is not None:
+            self.values = mdp.StateVector(compiled, values)
+            self.policy = mdp.StateVector(compiled, policy)
+            return
+        self.values = util.Counter()
+        for i, state in enumerate(compiled.states):
+            self.values[state] = values[i]
+        self.policy = {}
+        for i, action in enumerate(policy):
+            self.policy[compiled.states[i]] = action
 
 
     def getValue(self, state):
@@ -76,8 +667,11 @@ class ValueIterationAgent(ValueEstimationAgent):
           Compute the Q-value of action in state from the
           value function stored in self.values.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        qValue = 0
+        for nextState, prob in self.mdp.getTransitionStatesAndProbs(state, action):
+            reward = self.mdp.getReward(state, action, nextState)
+            qValue += prob * (reward + self.discount * self.values[nextState])
+        return qValue
 
     def computeActionFromValues(self, state):
         """
@@ -88,19 +682,79 @@ class ValueIterationAgent(ValueEstimationAgent):
           there are no legal actions, which is the case at the
           terminal state, you should return None.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        bestAction, bestValue = None, None
+        for action in self.mdp.getPossibleActions(state):
+            qValue = self.computeQValueFromValues(state, action)
+            if bestAction is None or qValue > bestValue:
+                bestAction, bestValue = action, qValue
+        return bestAction
 
     def getPolicy(self, state):
+        if self.policy is not None:
+            return self.policy[state]
         return self.computeActionFromValues(state)
 
     def getAction(self, state):
         "Returns the policy at the state (no exploration)."
-        return self.computeActionFromValues(state)
+        return self.getPolicy(state)
 
     def getQValue(self, state, action):
         return self.computeQValueFromValues(state, action)
 
+    def getValueVector(self, compiled):
+        "getValue of every state of compiled, as a list by state id."
+        getValue = self.getValue
+        return [getValue(state) for state in compiled.states]
+
+    def getQTable(self, states, actionFn):
+        """
+          One pass over the compiled transition arrays instead of a
+          getTransitionStatesAndProbs call per pair.  The sums are those
+          of computeQValueFromValues term for term, so the table matches
+          getQValue exactly.
+        """
+        compiled = self.mdp.compile()
+        values = self.getValueVector(compiled)
+        stateIndex, actionStart, rowStart, rowAction = (compiled.stateIndex, compiled.actionStart,
+                                                        compiled.rowStart, compiled.rowAction)
+        nextState, prob, reward = compiled.nextState, compiled.prob, compiled.reward
+        discount = self.discount
+        qTable = {}
+        for state in states:
+            i = stateIndex[state]
+            rowValues = {}
+            for r in range(actionStart[i], actionStart[i+1]):
+                qValue = 0
+                for k in range(rowStart[r], rowStart[r+1]):
+                    qValue += prob[k] * (reward[k] + discount * values[nextState[k]])
+                rowValues[rowAction[r]] = qValue
+            for action in actionFn(state):
+                if action in rowValues:
+                    qTable[(state, action)] = rowValues[action]
+                else:
+                    qTable[(state, action)] = self.computeQValueFromValues(state, action)
+        return qTable
+
+    def getValueTable(self, states):
+        """
+          Without a stored policy, the policy comes from one greedyPolicy
+          pass over the compiled mdp, which breaks ties the same way as
+          computeActionFromValues.
+        """
+        if self.policy is not None:
+            return ValueEstimationAgent.getValueTable(self, states)
+        compiled = self.mdp.compile()
+        values = self.getValueVector(compiled)
+        greedy = greedyPolicy(compiled, values, self.discount)
+        stateIndex = compiled.stateIndex
+        valueTable = {}
+        policy = {}
+        for state in states:
+            i = stateIndex[state]
+            valueTable[state] = values[i]
+            policy[state] = greedy[i]
+        return valueTable, policy
+
 class AsynchronousValueIterationAgent(ValueIterationAgent):
     """
         * Please read learningAgents.py before reading this.*
@@ -110,7 +764,8 @@ class AsynchronousValueIterationAgent(ValueIterationAgent):
         for a given number of iterations using the supplied
         discount factor.
     """
-    def __init__(self, mdp, discount = 0.9, iterations = 1000):
+    def __init__(self, mdp, discount = 0.9, iterations = 1000, tolerance = None, timeBudget = None,
+                 checkpoint = None):
         """
           Your cyclic value iteration agent should take an mdp on
           construction, run the indicated number of iterations,
@@ -125,11 +780,36 @@ class AsynchronousValueIterationAgent(ValueIterationAgent):
               mdp.getTransitionStatesAndProbs(state, action)
               mdp.getReward(state)
               mdp.isTerminal(state)
+
+          With a tolerance, the agent also stops at the end of the first
+          full cycle through the states whose largest change meets it.
+          A timeBudget is checked after every update; it and checkpoint
+          work as for ValueIterationAgent.  The largest change so far in the current
+          cycle is kept in self.cycleResidual, so a resumed cycle is
+          judged on all of its updates.
         """
-        ValueIterationAgent.__init__(self, mdp, discount, iterations)
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
 
     def runValueIteration(self):
-        "*** YOUR CODE HERE ***"
+        states = self.mdp.getStates()
+        for i in range(self.completedIterations, self.iterations):
+            state = states[i % len(states)]
+            value = self.computeBestQValue(state)
+            if value is not None:
+                self.cycleResidual = max(self.cycleResidual, abs(value - self.values[state]))
+                self.values[state] = value
+                self.stats.backups += 1
+            self.completedIterations = i + 1
+            if (i + 1) % len(states) == 0:
+                self.stats.residuals.append(self.cycleResidual)
+                self.cycleResidual = 0.0
+                if self.hasConverged(self.stats.residuals[-1]):
+                    self.stats.converged = True
+                    break
+            if self.outOfTime():
+                break
+        self.stats.partialSweep = self.completedIterations % len(states) != 0
 
 class PrioritizedSweepingValueIterationAgent(AsynchronousValueIterationAgent):
     """
@@ -139,15 +819,675 @@ class PrioritizedSweepingValueIterationAgent(AsynchronousValueIterationAgent):
         (see mdp.py) on initialization and runs prioritized sweeping value iteration
         for a given number of iterations using the supplied parameters.
     """
-    def __init__(self, mdp, discount = 0.9, iterations = 100, theta = 1e-5):
+    def __init__(self, mdp, discount = 0.9, iterations = 100, theta = 1e-5, tolerance = None,
+                 indexedQueue = True, timeBudget = None, checkpoint = None):
         """
           Your prioritized sweeping value iteration agent should take an mdp on
           construction, run the indicated number of iterations,
           and then act according to the resulting policy.
+
+          With a tolerance, the agent also stops once the change of the
+          highest-priority state meets it.
+
+          indexedQueue selects util.IndexedPriorityQueue, whose update is
+          O(log n); pass False to use the plain util.PriorityQueue.  Both
+          pop states in the same order.
         """
         self.theta = theta
-        ValueIterationAgent.__init__(self, mdp, discount, iterations)
+        self.indexedQueue = indexedQueue
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
+
+    def runValueIteration(self):
+        states = self.mdp.getStates()
+        if self.indexedQueue:
+            queue = util.IndexedPriorityQueue()
+        else:
+            queue = util.PriorityQueue()
+        for state in states:
+            value = self.computeBestQValue(state)
+            if value is not None:
+                queue.push(state, -abs(self.values[state] - value))
+
+        residual, pending = 0.0, 0
+        for i in range(self.iterations):
+            if queue.isEmpty():
+                self.stats.converged = True
+                break
+            state = queue.pop()
+            value = self.computeBestQValue(state)
+            change = abs(value - self.values[state])
+            if self.hasConverged(change):
+                self.stats.converged = True
+                break
+            residual = max(residual, change)
+            self.values[state] = value
+            self.stats.backups += 1
+            pending += 1
+            for predecessor in self.mdp.getPredecessorStates(state):
+                diff = abs(self.values[predecessor] - self.computeBestQValue(predecessor))
+                if diff > self.theta:
+                    queue.update(predecessor, -diff)
+            if pending == len(states):
+                self.stats.residuals.append(residual)
+                residual, pending = 0.0, 0
+            if self.outOfTime():
+                break
+        if pending > 0 or len(self.stats.residuals) == 0:
+            self.stats.residuals.append(residual)
+        self.stats.partialSweep = not self.stats.converged
+
+class TopologicalValueIterationAgent(AsynchronousValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A TopologicalValueIterationAgent splits the states of a Markov
+        decision process (see mdp.py) into strongly connected components
+        and solves them one at a time, downstream components first, each
+        to convergence.  A state is never backed up again once its
+        component is done, because nothing it depends on changes after
+        that.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100, tolerance = 1e-6, timeBudget = None,
+                 checkpoint = None):
+        """
+          Each component is swept in place, like the cyclic agent, until
+          a sweep meets tolerance (see hasConverged) or it has been swept
+          iterations times.  A component that is a single state without a
+          self-loop needs only one backup.  As with the cyclic agent,
+          terminal states are never updated.
+
+          The components, as lists of states in the order they were
+          solved, are kept in self.components.  A timeBudget is checked
+          after every sweep of a component.
+        """
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
+
+    def runValueIteration(self):
+        compiled = self.mdp.compile()
+        states = compiled.states
+        actionStart, rowStart, nextState = compiled.actionStart, compiled.rowStart, compiled.nextState
+        self.components = []
+        self.stats.converged = True
+        residual, pending = 0.0, 0
+        for component in mdp.stronglyConnectedComponents(compiled):
+            members = [states[i] for i in component]
+            self.components.append(members)
+            i = component[0]
+            acyclic = len(component) == 1 and i not in [nextState[k] for k in
+                                                        range(rowStart[actionStart[i]], rowStart[actionStart[i+1]])]
+            for sweep in range(self.iterations):
+                change = 0.0
+                for state in members:
+                    value = self.computeBestQValue(state)
+                    if value is None:
+                        continue
+                    diff = abs(value - self.values[state])
+                    change, residual = max(change, diff), max(residual, diff)
+                    self.values[state] = value
+                    self.stats.backups += 1
+                    pending += 1
+                    if pending == len(states):
+                        self.stats.residuals.append(residual)
+                        residual, pending = 0.0, 0
+                if acyclic or self.hasConverged(change):
+                    break
+                if self.outOfTime():
+                    break
+            else:
+                self.stats.converged = False
+            if self.stats.timedOut:
+                self.stats.converged = False
+                break
+        if pending > 0 or len(self.stats.residuals) == 0:
+            self.stats.residuals.append(residual)
+        self.stats.partialSweep = not self.stats.converged
+
+class RealTimeDynamicProgrammingAgent(ValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A RealTimeDynamicProgrammingAgent runs labelled RTDP (LRTDP, Bonet
+        and Geffner 2003) on a Markov decision process (see mdp.py).
+        Rather than sweeping getStates(), it runs greedy trials from the
+        start state and backs up only the states they visit.  A state is
+        labelled solved once every state its greedy policy can reach has
+        a Bellman residual within tolerance.  The run stops when the start
+        state is solved.  States that good policies never reach are never
+        touched.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 10000, tolerance = 1e-4,
+                 valueBound = None, maxTrialLength = 10000, seed = None, timeBudget = None,
+                 checkpoint = None):
+        """
+          iterations caps the number of trials and maxTrialLength the
+          steps in each.  Trial outcomes are drawn from
+          random.Random(seed).
+
+          LRTDP needs optimistic starting values.  Every state not yet
+          backed up is valued at valueBound, which must be at least its
+          optimal value.  By default it is max(0, largest reward) /
+          (1 - discount), which compiles the mdp once to find the largest
+          reward; pass a tighter valueBound to avoid that.
+
+          self.touched is the set of states whose value was looked at; its
+          size is how much of the mdp the agent needed.  The states it
+          backed up are the keys of self.values.  self.stats.residuals
+          holds the largest change made in each trial.
+        """
+        self.valueBound = valueBound
+        self.maxTrialLength = maxTrialLength
+        self.random = random.Random(seed)
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
+
+    def resolve(self, discount = None, noise = None, livingReward = None, tolerance = None,
+                compareCold = False):
+        """
+          Not supported: labelling is only sound from optimistic values,
+          and after a change of parameters neither the values of the last
+          solve nor the default valueBound need be upper bounds any more.
+        """
+        raise Exception('RTDP cannot be warm-started; build a new agent for the new parameters')
+
+    def getValueBound(self):
+        if self.valueBound is None:
+            if self.discount >= 1:
+                raise Exception('RTDP needs a valueBound when the discount is not below one')
+            maxReward = max([0] + list(self.mdp.compile().reward))
+            self.valueBound = maxReward / (1.0 - self.discount)
+        return self.valueBound
+
+    def getTouchedCount(self):
+        "The number of distinct states whose value the agent looked at."
+        return len(self.touched)
+
+    def getValue(self, state):
+        if state in self.values:
+            return self.values[state]
+        if self.mdp.isTerminal(state) or len(self.mdp.getPossibleActions(state)) == 0:
+            return 0
+        return self.getValueBound()
+
+    def computeQValueFromValues(self, state, action):
+        qValue = 0
+        for nextState, prob in self.mdp.getTransitionStatesAndProbs(state, action):
+            reward = self.mdp.getReward(state, action, nextState)
+            self.touched.add(nextState)
+            qValue += prob * (reward + self.discount * self.getValue(nextState))
+        return qValue
+
+    def backup(self, state):
+        """
+          Sets the value of state to its best Q-value and returns the
+          greedy action and the size of the change (None, 0 for states
+          without actions).
+        """
+        self.touched.add(state)
+        action = self.computeActionFromValues(state)
+        if action is None:
+            return None, 0
+        value = self.computeQValueFromValues(state, action)
+        change = abs(value - self.getValue(state))
+        self.values[state] = value
+        self.stats.backups += 1
+        return action, change
+
+    def sampleNextState(self, state, action):
+        rand = self.random.random()
+        total = 0.0
+        for nextState, prob in self.mdp.getTransitionStatesAndProbs(state, action):
+            total += prob
+            if rand < total:
+                return nextState
+        return nextState
+
+    def checkSolved(self, state, solved):
+        """
+          The labelling procedure: looks at every state the greedy policy
+          can reach from state, stopping at solved states.  If all of
+          their residuals are within tolerance they are all labelled
+          solved; otherwise they are backed up, deepest first.
+        """
+        allConverged = True
+        frontier, closed, seen = [state], [], set([state])
+        while frontier:
+            current = frontier.pop()
+            closed.append(current)
+            action = self.computeActionFromValues(current)
+            if action is None:
+                continue
+            if abs(self.computeQValueFromValues(current, action) - self.getValue(current)) > self.tolerance:
+                allConverged = False
+                continue
+            for nextState, prob in self.mdp.getTransitionStatesAndProbs(current, action):
+                if prob > 0 and nextState not in solved and nextState not in seen:
+                    seen.add(nextState)
+                    frontier.append(nextState)
+        if allConverged:
+            solved.update(closed)
+        else:
+            while closed:
+                self.backup(closed.pop())
+        return allConverged
+
+    def runValueIteration(self):
+        if self.tolerance is None:
+            raise Exception('RTDP needs a tolerance for its convergence labels')
+        self.touched = set()
+        start = self.mdp.getStartState()
+        solved = set()
+        for trial in range(self.iterations):
+            if start in solved:
+                break
+            state, visited, residual = start, [], 0.0
+            while state not in solved and len(visited) < self.maxTrialLength:
+                visited.append(state)
+                action, change = self.backup(state)
+                residual = max(residual, change)
+                if action is None:
+                    break
+                state = self.sampleNextState(state, action)
+            self.stats.residuals.append(residual)
+            while visited:
+                if not self.checkSolved(visited.pop(), solved):
+                    break
+            if self.outOfTime():
+                break
+        self.stats.converged = start in solved
+
+class BoundedValueIterationAgent(ValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A BoundedValueIterationAgent keeps an upper and a lower bound on
+        the value of every state of a Markov decision process (see
+        mdp.py) and sweeps both until they are within tolerance of each
+        other everywhere.  Along the way it permanently eliminates every
+        action whose upper-bound Q-value falls below the lower-bound
+        Q-value of another action in the same state: such an action can
+        never be optimal, so later sweeps skip it.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 1000, tolerance = 1e-3,
+                 lowerBound = None, upperBound = None, timeBudget = None, checkpoint = None):
+        """
+          lowerBound and upperBound must bound the value of every
+          non-terminal state under any policy; by default they are
+          worked out from the rewards (see getStartBounds).  Sweeps are
+          in place, and from such bounds the lower bounds only rise and
+          the upper bounds only fall.  The policy that is greedy on the
+          lower bounds is therefore worth at least the lower bounds, and
+          is within tolerance of optimal once the sweeps stop on the gap.
+
+          self.values (and getValue) are the lower bounds, and
+          self.upperValues the upper ones.  self.stats.residuals holds
+          the largest bound gap after each sweep.  self.rowsPerSweep
+          counts the (state, action) rows each sweep evaluated; see
+          getEliminationRate.
+        """
+        self.lowerBound = lowerBound
+        self.upperBound = upperBound
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
+
+    def resolve(self, discount = None, noise = None, livingReward = None, tolerance = None,
+                compareCold = False):
+        """
+          Not supported: the sweeps always start from getStartBounds, as
+          the bounds of the last solve need not bound the values under
+          new parameters, so a re-solve would just be a cold one.
+        """
+        raise Exception('Bounded value iteration cannot be warm-started; build a new agent for the new parameters')
+
+    def getEliminationRate(self):
+        """
+          The fraction of the (state, action) rows of non-terminal states
+          that had been eliminated when the solve stopped.
+        """
+        if self.totalRows == 0:
+            return 0.0
+        return 1.0 - float(self.activeRows) / self.totalRows
+
+    def getStartBounds(self, compiled):
+        """
+          The given bounds, or default ones.  A reward for entering a
+          terminal state is collected at most once, while any other can
+          recur every step.  So values lie between
+          min(0, other rewards) / (1 - discount) + min(0, terminal rewards)
+          and the same with max.
+        """
+        lowerBound, upperBound = self.lowerBound, self.upperBound
+        if lowerBound is None or upperBound is None:
+            if self.discount >= 1:
+                raise Exception('Bounded value iteration needs explicit bounds when the discount is not below one')
+            terminal, nextState, reward = compiled.terminal, compiled.nextState, compiled.reward
+            recurring, final = [0], [0]
+            for k in range(len(nextState)):
+                if terminal[nextState[k]]:
+                    final.append(reward[k])
+                else:
+                    recurring.append(reward[k])
+            if lowerBound is None:
+                lowerBound = min(recurring) / (1.0 - self.discount) + min(final)
+            if upperBound is None:
+                upperBound = max(recurring) / (1.0 - self.discount) + max(final)
+        return lowerBound, upperBound
 
     def runValueIteration(self):
-        "*** YOUR CODE HERE ***"
+        if self.tolerance is None:
+            raise Exception('Bounded value iteration needs a tolerance on the bound gap')
+        compiled = self.mdp.compile()
+        terminal, actionStart, rowStart = compiled.terminal, compiled.actionStart, compiled.rowStart
+        nextState, prob, reward = compiled.nextState, compiled.prob, compiled.reward
+        discount = self.discount
+        numStates = compiled.numStates
+        lowerBound, upperBound = self.getStartBounds(compiled)
+
+        active = [[] for i in range(numStates)]
+        for i in range(numStates):
+            if not terminal[i]:
+                active[i] = list(range(actionStart[i], actionStart[i+1]))
+        lower = compiled.newVector(active[i] and lowerBound or 0.0 for i in range(numStates))
+        upper = compiled.newVector(active[i] and upperBound or 0.0 for i in range(numStates))
+        self.totalRows = sum([len(rows) for rows in active])
+        self.rowsPerSweep = []
+        backupsPerSweep = len([rows for rows in active if rows])
+
+        for sweep in range(self.iterations):
+            gap, evaluated = 0.0, 0
+            for i in range(numStates):
+                rows = active[i]
+                if not rows:
+                    continue
+                bestLower = bestUpper = None
+                upperQValues = []
+                for r in rows:
+                    lowerQ = upperQ = 0
+                    for k in range(rowStart[r], rowStart[r+1]):
+                        j = nextState[k]
+                        lowerQ += prob[k] * (reward[k] + discount * lower[j])
+                        upperQ += prob[k] * (reward[k] + discount * upper[j])
+                    upperQValues.append(upperQ)
+                    if bestLower is None or lowerQ > bestLower:
+                        bestLower = lowerQ
+                    if bestUpper is None or upperQ > bestUpper:
+                        bestUpper = upperQ
+                evaluated += len(rows)
+                if len(rows) > 1 and min(upperQValues) < bestLower:
+                    active[i] = [r for r, upperQ in zip(rows, upperQValues) if upperQ >= bestLower]
+                lower[i], upper[i] = bestLower, bestUpper
+                gap = max(gap, bestUpper - bestLower)
+            self.rowsPerSweep.append(evaluated)
+            self.stats.backups += backupsPerSweep
+            self.stats.residuals.append(gap)
+            if gap <= self.tolerance:
+                self.stats.converged = True
+                break
+            if self.outOfTime():
+                break
+
+        self.activeRows = sum([len(rows) for rows in active])
+        self.storeSolution(compiled, lower)
+        self.upperValues = mdp.StateVector(compiled, upper)
+
+class PolicyIterationAgent(ValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A PolicyIterationAgent takes a Markov decision process
+        (see mdp.py) on initialization and alternates policy evaluation
+        with greedy policy improvement until the policy stops changing
+        or the given number of iterations has been run.
+    """
+    # Relative margin by which another action must beat the current one
+    # to replace it; exact evaluation leaves ties a few ulps apart.
+    tieTolerance = 1e-10
+
+    def __init__(self, mdp, discount = 0.9, iterations = 100, evaluationSweeps = None, tolerance = 1e-3,
+                 timeBudget = None, checkpoint = None):
+        """
+          evaluationSweeps controls how each policy is evaluated:
+              None  solve the linear system V = R + discount * P V exactly
+              k     run k synchronous sweeps of V(s) = Q(s, policy(s)),
+                    starting from the previous values (modified policy
+                    iteration)
+
+          With exact evaluation the agent stops when improvement leaves
+          the policy unchanged, as that policy is then optimal.  A few
+          sweeps can leave the values far from those of the policy, so
+          with truncated evaluation it also waits until the Bellman
+          residual meets the tolerance (see hasConverged); there the
+          tolerance cannot be None.
+        """
+        self.evaluationSweeps = evaluationSweeps
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, tolerance=tolerance,
+                                     timeBudget=timeBudget, checkpoint=checkpoint)
+
+    def getWarmPolicy(self):
+        return self.policy
+
+    def runValueIteration(self):
+        if self.evaluationSweeps is not None and self.tolerance is None:
+            raise Exception('Policy iteration with truncated evaluation needs a tolerance on the Bellman residual')
+        states = self.mdp.getStates()
+        if self.policy is None:
+            self.policy = {}
+            for state in states:
+                actions = self.mdp.getPossibleActions(state)
+                if self.mdp.isTerminal(state) or len(actions) == 0:
+                    self.policy[state] = None
+                else:
+                    self.policy[state] = actions[0]
+
+        for i in range(self.iterations):
+            oldValues = self.values
+            if self.evaluationSweeps is None:
+                self.evaluatePolicyExactly(states)
+            else:
+                self.evaluatePolicyIteratively(states, self.evaluationSweeps)
+
+            # Greedy improvement; keep the current action unless another
+            # one is better by more than rounding error (relative to the
+            # Q-value), so the policy cannot cycle on ties.
+            stable = True
+            residual = 0.0
+            for state in states:
+                action = self.policy[state]
+                if action is None:
+                    continue
+                bestValue = maxValue = self.computeQValueFromValues(state, action)
+                for other in self.mdp.getPossibleActions(state):
+                    qValue = self.computeQValueFromValues(state, other)
+                    if qValue > bestValue + self.tieTolerance * max(1.0, abs(bestValue)):
+                        action, bestValue = other, qValue
+                    maxValue = max(maxValue, qValue)
+                if action != self.policy[state]:
+                    self.policy[state] = action
+                    stable = False
+                residual = max(residual, abs(maxValue - self.values[state]))
+                self.stats.backups += 1
+            self.stats.residuals.append(max([abs(self.values[state] - oldValues[state])
+                                             for state in states]))
+            if stable and (self.evaluationSweeps is None or self.hasConverged(residual)):
+                self.stats.converged = True
+                break
+            if self.outOfTime():
+                break
+
+    def evaluatePolicyIteratively(self, states, sweeps):
+        for k in range(sweeps):
+            newValues = util.Counter()
+            for state in states:
+                action = self.policy[state]
+                if action is not None:
+                    newValues[state] = self.computeQValueFromValues(state, action)
+                    self.stats.backups += 1
+            self.values = newValues
+
+    def evaluatePolicyExactly(self, states):
+        """
+          Solves (I - discount * P) V = R for the current policy by sparse
+          Gaussian elimination.  With discount < 1 the system is diagonally
+          dominant, so no pivoting is needed; fill-in stays within the
+          bandwidth of the state ordering.
+        """
+        policyStates = [state for state in states if self.policy[state] is not None]
+        index = {}
+        for i, state in enumerate(policyStates):
+            index[state] = i
+        n = len(policyStates)
+
+        rows = []
+        rhs = []
+        for i, state in enumerate(policyStates):
+            action = self.policy[state]
+            row = {i: 1.0}
+            b = 0.0
+            for nextState, prob in self.mdp.getTransitionStatesAndProbs(state, action):
+                b += prob * self.mdp.getReward(state, action, nextState)
+                if nextState in index:
+                    j = index[nextState]
+                    row[j] = row.get(j, 0.0) - self.discount * prob
+            rows.append(row)
+            rhs.append(b)
+
+        # below[j] holds the rows i > j that still have a coefficient in column j.
+        below = [set() for i in range(n)]
+        for i, row in enumerate(rows):
+            for j in row:
+                if j < i:
+                    below[j].add(i)
+        for k in range(n):
+            pivotRow = rows[k]
+            pivot = pivotRow[k]
+            if abs(pivot) < 1e-12:
+                raise Exception('Policy evaluation is singular; use evaluationSweeps for this policy')
+            for i in sorted(below[k]):
+                row = rows[i]
+                factor = row.pop(k) / pivot
+                for j, coefficient in pivotRow.items():
+                    if j == k:
+                        continue
+                    if j not in row:
+                        row[j] = 0.0
+                        if j < i:
+                            below[j].add(i)
+                    row[j] -= factor * coefficient
+                rhs[i] -= factor * rhs[k]
+
+        solution = [0.0] * n
+        for k in range(n - 1, -1, -1):
+            total = rhs[k]
+            for j, coefficient in rows[k].items():
+                if j != k:
+                    total -= coefficient * solution[j]
+            solution[k] = total / rows[k][k]
+
+        self.values = util.Counter()
+        for i, state in enumerate(policyStates):
+            self.values[state] = solution[i]
+
+class ValueIterationView(ValueIterationAgent):
+    """
+        A read-only ValueIterationAgent over values that were computed
+        elsewhere, for example by multiDiscountValueIteration.  Building
+        one does not run value iteration; it answers getValue, getPolicy,
+        getQValue and getAction from the values (and policy table, if
+        one is given) it was built with.
+    """
+    def __init__(self, mdp, discount, values, iterations, policy = None, stats = None):
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.engine = 'batched'
+        self.tolerance = None
+        self.timeBudget = None
+        self.completedIterations = iterations
+        self.snapshotIterations = set()
+        self.snapshots = {}
+        self.values = values
+        self.policy = policy
+        self.stats = stats or ValueIterationStats()
+
+    def solve(self):
+        raise Exception('A ValueIterationView cannot be re-solved')
+
+def multiDiscountValueIteration(mdp, discounts, iterations = 100, tolerance = None):
+    """
+      Solves the same mdp under several discounts at once and returns one
+      ValueIterationView per discount, in the order given.
+
+      The mdp is compiled once and every sweep reads each transition row
+      a single time, applying it to the stack of value vectors (one per
+      discount).  Each discount gets exactly the values that
+      ValueIterationAgent(mdp, discount, iterations, tolerance=tolerance)
+      would compute: with a tolerance, a discount drops out of the stack
+      as soon as it converges.
+    """
+    startTime = time.time()
+    compiled = mdp.compile()
+    terminal, actionStart, rowStart = compiled.terminal, compiled.actionStart, compiled.rowStart
+    nextState, prob, reward = compiled.nextState, compiled.prob, compiled.reward
+    numStates = compiled.numStates
+    backupsPerSweep = len([i for i in range(numStates)
+                           if not terminal[i] and actionStart[i] < actionStart[i+1]])
+
+    allStats = [ValueIterationStats() for discount in discounts]
+    finalValues = [None] * len(discounts)
+    # active[d] is the index (into discounts) of the d-th value vector
+    active = list(range(len(discounts)))
+    values = [[0.0] * numStates for discount in discounts]
+    for iteration in range(iterations):
+        if len(active) == 0:
+            break
+        gammas = [discounts[index] for index in active]
+        newValues = [[0.0] * numStates for index in active]
+        for i in range(numStates):
+            if terminal[i]:
+                continue
+            best = None
+            for r in range(actionStart[i], actionStart[i+1]):
+                successors = [(prob[k], reward[k], nextState[k])
+                              for k in range(rowStart[r], rowStart[r+1])]
+                qValues = []
+                for gamma, vector in zip(gammas, values):
+                    qValue = 0
+                    for p, rw, j in successors:
+                        qValue += p * (rw + gamma * vector[j])
+                    qValues.append(qValue)
+                if best is None:
+                    best = qValues
+                else:
+                    best = [q if q > b else b for q, b in zip(qValues, best)]
+            if best is not None:
+                for vector, value in zip(newValues, best):
+                    vector[i] = value
+
+        stillActive = []
+        for d, index in enumerate(active):
+            residual = max([abs(new - old) for new, old in zip(newValues[d], values[d])])
+            stats = allStats[index]
+            stats.residuals.append(residual)
+            stats.backups += backupsPerSweep
+            if withinTolerance(residual, discounts[index], tolerance):
+                stats.converged = True
+                finalValues[index] = newValues[d]
+            else:
+                stillActive.append(d)
+        active = [active[d] for d in stillActive]
+        values = [newValues[d] for d in stillActive]
+    for index, vector in zip(active, values):
+        finalValues[index] = vector
 
+    wallTime = time.time() - startTime
+    views = []
+    for index, discount in enumerate(discounts):
+        values = util.Counter()
+        policy = {}
+        for i, action in enumerate(greedyPolicy(compiled, finalValues[index], discount)):
+            values[compiled.states[i]] = finalValues[index][i]
+            policy[compiled.states[i]] = action
+        allStats[index].wallTime = wallTime
+        views.append(ValueIterationView(mdp, discount, values, iterations, policy, allStats[index]))
+    return views